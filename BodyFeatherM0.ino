@@ -56,6 +56,9 @@
 #define ACTION_REAR_TOP_CLOSE        13
 #define ACTION_STATUS_UPDATE         0x40
 #define ACTION_STEALTH_PLAY_SOUND    0x30
+// Several PanelCommands in one frame, see handleBodyRadioCommand().
+#define ACTION_MULTI_COMMAND         0x50
+#define MULTI_COMMAND_VERSION        1
 
 #define GROUP_ALL_SERVOS 255
 
@@ -374,6 +377,26 @@ void handleStealthI2CCommand(uint8_t command) {
   rf69.setModeRx();
 }
 
+void runBodyRadioCommand(const PanelCommand &cmd, uint8_t from) {
+  char line2[22];
+  snprintf(line2, sizeof(line2), "from %u act 0x%02X", from, cmd.actionType);
+  oledStatus("Radio RX", line2, "");
+
+  switch (cmd.actionType) {
+    case ACTION_STEALTH_PLAY_SOUND:
+      Serial.print("Mapped radio action: play STEALTH sound bank ");
+      Serial.println(cmd.targetGroup);
+      playStealthSoundBank(cmd.targetGroup);
+      break;
+
+    default:
+      Serial.print("No mapped Body radio action for actionType 0x");
+      Serial.println(cmd.actionType, HEX);
+      oledStatus("Radio RX", "Unknown action", "");
+      break;
+  }
+}
+
 void handleBodyRadioCommand(uint8_t* data, uint8_t len, uint8_t from) {
   Serial.println();
   Serial.print("Radio command received from node ");
@@ -399,22 +422,22 @@ void handleBodyRadioCommand(uint8_t* data, uint8_t len, uint8_t from) {
   PanelCommand cmd;
   memcpy(&cmd, data, sizeof(PanelCommand));
 
-  char line2[22];
-  snprintf(line2, sizeof(line2), "from %u act 0x%02X", from, cmd.actionType);
-  oledStatus("Radio RX", line2, "");
-
-  switch (cmd.actionType) {
-    case ACTION_STEALTH_PLAY_SOUND:
-      Serial.print("Mapped radio action: play STEALTH sound bank ");
-      Serial.println(cmd.targetGroup);
-      playStealthSoundBank(cmd.targetGroup);
-      break;
-
-    default:
-      Serial.print("No mapped Body radio action for actionType 0x");
-      Serial.println(cmd.actionType, HEX);
-      oledStatus("Radio RX", "Unknown action", "");
-      break;
+  if (cmd.actionType == ACTION_MULTI_COMMAND) {
+    // Header shaped like a PanelCommand: format version, command count.
+    // The commands follow and run in order.
+    if (cmd.targetGroup != MULTI_COMMAND_VERSION ||
+        len != (cmd.position + 1) * sizeof(PanelCommand)) {
+      Serial.println("Unsupported multi-command frame. Ignoring.");
+      oledStatus("Radio RX", "Bad multi-command", "");
+    } else {
+      for (uint8_t i = 1; i <= cmd.position; i++) {
+        PanelCommand next;
+        memcpy(&next, data + i * sizeof(PanelCommand), sizeof(next));
+        runBodyRadioCommand(next, from);
+      }
+    }
+  } else {
+    runBodyRadioCommand(cmd, from);
   }
 
   rf69.setModeRx();
@@ -24,6 +24,18 @@
 
 #define GROUP_ALL_SERVOS 255
 
+// Group commands: one broadcast carrying a node mask and a PanelCommand.
+// This node's bit in the mask (NODE_BITS in r2n2_commands.py) is also its
+// reply slot.
+#define GROUP_NODE_BIT      0x04
+#define GROUP_REPLY_SLOT    2
+#define GROUP_REPLY_SLOT_MS 5
+#define GROUP_REPLY_SLOTS   4
+
+// Several PanelCommands in one frame, see runMultiCommand().
+#define ACTION_MULTI_COMMAND  0x50
+#define MULTI_COMMAND_VERSION 1
+
 #define SERVO_POS_OPEN    1
 #define SERVO_POS_CLOSED  2
 
@@ -47,6 +59,11 @@ struct PanelCommand {
   uint8_t reserved;
 };
 
+struct GroupCommand {
+  uint8_t nodeMask;
+  PanelCommand command;
+};
+
 struct ServoConfig {
   uint8_t pin;
   const char *name;
@@ -275,51 +292,119 @@ void setup() {
   Serial.println("Rear Panel ready.");
 }
 
+void runCommand(const PanelCommand &cmd) {
+  Serial.print("Action type: ");
+  Serial.println(cmd.actionType);
+
+  Serial.print("Target group: ");
+  Serial.println(cmd.targetGroup);
+
+  Serial.print("Position: ");
+  Serial.println(cmd.position);
+
+  if (cmd.actionType == ACTION_SERVO_GROUP_MOVE &&
+      cmd.targetGroup == GROUP_ALL_SERVOS) {
+    moveAllServos(cmd.position);
+  } else if (cmd.actionType == ACTION_REAR_TOP_TOGGLE) {
+    toggleRearTopDoor();
+  } else if (cmd.actionType == ACTION_REAR_TOP_OPEN) {
+    setRearTopDoor(SERVO_POS_OPEN);
+  } else if (cmd.actionType == ACTION_REAR_TOP_CLOSE) {
+    setRearTopDoor(SERVO_POS_CLOSED);
+  } else {
+    Serial.println("Unknown command.");
+  }
+}
+
+void runMultiCommand(const uint8_t *buffer, uint8_t len) {
+  // Header shaped like a PanelCommand: ACTION_MULTI_COMMAND, format
+  // version, command count. The commands follow and run in order.
+  PanelCommand header;
+  memcpy(&header, buffer, sizeof(header));
+
+  if (header.targetGroup != MULTI_COMMAND_VERSION ||
+      len != (header.position + 1) * sizeof(PanelCommand)) {
+    Serial.print("Unsupported multi-command frame, version ");
+    Serial.print(header.targetGroup);
+    Serial.print(" len ");
+    Serial.println(len);
+    return;
+  }
+
+  Serial.print("Multi-command frame with ");
+  Serial.print(header.position);
+  Serial.println(" commands.");
+
+  for (uint8_t i = 1; i <= header.position; i++) {
+    PanelCommand cmd;
+    memcpy(&cmd, buffer + i * sizeof(PanelCommand), sizeof(cmd));
+    runCommand(cmd);
+  }
+}
+
+void confirmGroupCommand(uint8_t from, uint8_t id, unsigned long receivedAt) {
+  // RHReliableDatagram never ACKs a broadcast, so send the ACK frame here,
+  // in this node's slot so the panels do not answer on top of each other.
+  // Every node then waits out the whole window and starts moving together.
+  uint8_t ack = '!';
+
+  while (millis() - receivedAt < GROUP_REPLY_SLOT * GROUP_REPLY_SLOT_MS) {}
+
+  manager.setHeaderId(id);
+  manager.setHeaderFlags(RH_FLAGS_ACK, RH_FLAGS_ACK | RH_FLAGS_RETRY);
+  manager.sendto(&ack, sizeof(ack), from);
+  manager.waitPacketSent();
+  manager.setHeaderFlags(0, RH_FLAGS_ACK);
+
+  while (millis() - receivedAt < GROUP_REPLY_SLOTS * GROUP_REPLY_SLOT_MS) {}
+}
+
 void loop() {
   uint8_t buffer[RH_RF69_MAX_MESSAGE_LEN];
   uint8_t len = sizeof(buffer);
   uint8_t from;
+  uint8_t to;
+  uint8_t id;
 
   if (manager.available()) {
-    if (manager.recvfromAck(buffer, &len, &from)) {
+    if (manager.recvfromAck(buffer, &len, &from, &to, &id)) {
+      unsigned long receivedAt = millis();
       digitalWrite(LED, HIGH);
 
       Serial.println();
       Serial.print("Radio command received from node ");
       Serial.println(from);
 
-      if (len != sizeof(PanelCommand)) {
+      PanelCommand cmd;
+
+      if (to == RH_BROADCAST_ADDRESS && len == sizeof(GroupCommand)) {
+        GroupCommand group;
+        memcpy(&group, buffer, sizeof(group));
+
+        if (!(group.nodeMask & GROUP_NODE_BIT)) {
+          Serial.println("Group command for other nodes.");
+          digitalWrite(LED, LOW);
+          return;
+        }
+
+        Serial.println("Group command.");
+        confirmGroupCommand(from, id, receivedAt);
+        cmd = group.command;
+      } else if (len > sizeof(PanelCommand) && buffer[0] == ACTION_MULTI_COMMAND) {
+        runMultiCommand(buffer, len);
+        digitalWrite(LED, LOW);
+        return;
+      } else if (len != sizeof(PanelCommand)) {
         Serial.print("Unexpected packet size: ");
         Serial.println(len);
         digitalWrite(LED, LOW);
         return;
-      }
-
-      PanelCommand cmd;
-      memcpy(&cmd, buffer, sizeof(cmd));
-
-      Serial.print("Action type: ");
-      Serial.println(cmd.actionType);
-
-      Serial.print("Target group: ");
-      Serial.println(cmd.targetGroup);
-
-      Serial.print("Position: ");
-      Serial.println(cmd.position);
-
-      if (cmd.actionType == ACTION_SERVO_GROUP_MOVE &&
-          cmd.targetGroup == GROUP_ALL_SERVOS) {
-        moveAllServos(cmd.position);
-      } else if (cmd.actionType == ACTION_REAR_TOP_TOGGLE) {
-        toggleRearTopDoor();
-      } else if (cmd.actionType == ACTION_REAR_TOP_OPEN) {
-        setRearTopDoor(SERVO_POS_OPEN);
-      } else if (cmd.actionType == ACTION_REAR_TOP_CLOSE) {
-        setRearTopDoor(SERVO_POS_CLOSED);
       } else {
-        Serial.println("Unknown command.");
+        memcpy(&cmd, buffer, sizeof(cmd));
       }
 
+      runCommand(cmd);
+
       digitalWrite(LED, LOW);
     }
   }
@@ -0,0 +1,109 @@
+# R2N2 channel airtime for the RPi5 controller
+#
+# How long each packet keeps the 915 MHz channel busy, worked out from the
+# RFM69 packet format, and a sliding window of everything on air. The radio
+# worker charges every packet it sends or hears, paces ordinary commands once
+# the Pi has used its share of the window, and the Status page shows how
+# busy the channel is and who is using it.
+
+from collections import deque
+
+
+# RH_RF69 on the Feathers and adafruit_rfm69 on the Pi default to GFSK at
+# 250 kbps with a 4 byte preamble and the 2 sync bytes 0x2D 0xD4. Each
+# packet is then a length byte, the 4 byte RadioHead header, the payload and
+# a CRC-16.
+RF69_BITRATE = 250000
+RF69_PREAMBLE_BYTES = 4
+RF69_SYNC_BYTES = 2
+RF69_LENGTH_BYTES = 1
+RF69_CRC_BYTES = 2
+RH_HEADER_BYTES = 4
+
+AIRTIME_WINDOW_SECONDS = 1.0
+# Share of the window the Pi's own packets may use before ordinary commands
+# are held back. None only measures.
+AIRTIME_BUDGET = 0.25
+
+
+def time_on_air(payload_len, bitrate=RF69_BITRATE, preamble=RF69_PREAMBLE_BYTES, sync=RF69_SYNC_BYTES):
+    frame = preamble + sync + RF69_LENGTH_BYTES + RH_HEADER_BYTES + payload_len + RF69_CRC_BYTES
+    return frame * 8 / bitrate
+
+
+class AirtimeBudget:
+    # Packets on air in the last `window` seconds, with running totals for
+    # the Pi's own packets and per sending node for the ones it heard.
+    # Charged and expired from the radio thread only; the UI just reads the
+    # totals.
+    def __init__(
+        self,
+        window=AIRTIME_WINDOW_SECONDS,
+        budget=AIRTIME_BUDGET,
+        bitrate=RF69_BITRATE,
+        preamble=RF69_PREAMBLE_BYTES,
+        sync=RF69_SYNC_BYTES,
+    ):
+        self.window = window
+        self.budget = budget
+        self.bitrate = bitrate
+        self.preamble = preamble
+        self.sync = sync
+
+        # (charged at, seconds, sender), sender None for the Pi's own.
+        self.events = deque()
+        self.tx_seconds = 0.0
+        self.rx_seconds = {}
+        self.peak = 0.0
+
+    def airtime(self, payload_len):
+        return time_on_air(payload_len, self.bitrate, self.preamble, self.sync)
+
+    def charge(self, payload_len, now, sender=None):
+        seconds = self.airtime(payload_len)
+        self.expire(now)
+        self.events.append((now, seconds, sender))
+        if sender is None:
+            self.tx_seconds += seconds
+        else:
+            self.rx_seconds[sender] = self.rx_seconds.get(sender, 0.0) + seconds
+        self.peak = max(self.peak, self.utilization())
+        return seconds
+
+    def expire(self, now):
+        events = self.events
+        while events and events[0][0] <= now - self.window:
+            at, seconds, sender = events.popleft()
+            if sender is None:
+                self.tx_seconds -= seconds
+            else:
+                self.rx_seconds[sender] -= seconds
+        if not events:
+            # Stops float error from piling up over a long show.
+            self.tx_seconds = 0.0
+            self.rx_seconds = dict.fromkeys(self.rx_seconds, 0.0)
+
+    def utilization(self):
+        return (self.tx_seconds + sum(self.rx_seconds.values())) / self.window
+
+    def tx_utilization(self):
+        return self.tx_seconds / self.window
+
+    def rx_utilization(self, sender):
+        return self.rx_seconds.get(sender, 0.0) / self.window
+
+    def tx_free_at(self, payload_len, now):
+        # Earliest time a packet this size fits in the Pi's budget, as the
+        # oldest of its packets leave the window.
+        if self.budget is None:
+            return now
+        allowed = self.budget * self.window
+        needed = self.tx_seconds + self.airtime(payload_len) - allowed
+        if needed <= 0:
+            return now
+        for at, seconds, sender in self.events:
+            if sender is None:
+                needed -= seconds
+                if needed <= 0:
+                    return at + self.window
+        return now
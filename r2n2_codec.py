@@ -0,0 +1,108 @@
+# R2N2 packet codec for the RPi5 controller
+#
+# RadioHead frames as the RFM69 driver returns them with with_header=True:
+# a 4 byte header (to, from, id, flags) followed by the body. Bodies sent to
+# the Feathers are the 4 byte PanelCommand struct from BodyFeatherM0.ino.
+#
+# Decoding reads through a memoryview, so the body is never copied. Command
+# payloads are packed once when the command table is built; the driver adds
+# the header itself on send.
+
+import struct
+
+from collections import namedtuple
+
+
+# RadioHead RHReliableDatagram header flags and ACK body
+RH_FLAGS_ACK = 0x80
+RH_FLAGS_RETRY = 0x40
+RH_BROADCAST_ADDRESS = 0xFF
+RH_ACK_PAYLOAD = b"!"
+
+# RH_RF69_MAX_MESSAGE_LEN: 64 byte FIFO minus length byte and header.
+RH_MAX_MESSAGE_LEN = 60
+
+RH_HEADER = struct.Struct("4B")
+RH_HEADER_LEN = RH_HEADER.size
+
+# actionType, targetGroup, position, reserved
+PANEL_COMMAND = struct.Struct("4B")
+PANEL_COMMAND_LEN = PANEL_COMMAND.size
+
+PanelCommand = namedtuple("PanelCommand", "action group position reserved")
+
+# nodeMask followed by a PanelCommand, sent once to RH_BROADCAST_ADDRESS.
+# Every Feather whose bit is set answers with a RadioHead ACK frame carrying
+# the broadcast's id, each in its own reply slot.
+GROUP_COMMAND = struct.Struct("5B")
+GROUP_COMMAND_LEN = GROUP_COMMAND.size
+
+GroupCommand = namedtuple("GroupCommand", "mask action group position reserved")
+
+# Several commands for one node in one frame: a PanelCommand shaped header
+# (ACTION_MULTI_COMMAND, version, count, 0) followed by count PanelCommands,
+# run in order. Feathers without support ACK it and then ignore it (the
+# panels check for 4 bytes, the Body sees an unknown action), so only send
+# it to reflashed nodes. Single commands stay 4 bytes.
+ACTION_MULTI_COMMAND = 0x50
+MULTI_COMMAND_VERSION = 1
+MULTI_COMMAND_MAX = RH_MAX_MESSAGE_LEN // PANEL_COMMAND_LEN - 1
+
+
+def decode_header(frame):
+    # Returns (dest, sender, ident, flags).
+    return RH_HEADER.unpack_from(frame, 0)
+
+
+def decode_frame(frame):
+    # Returns (dest, sender, ident, flags, body) with body a memoryview into
+    # frame, or None when frame is too short to hold a header.
+    if len(frame) < RH_HEADER_LEN:
+        return None
+    view = memoryview(frame)
+    dest, sender, ident, flags = RH_HEADER.unpack_from(view, 0)
+    return dest, sender, ident, flags, view[RH_HEADER_LEN:]
+
+
+def decode_panel_command(body, offset=0):
+    # None when there are not 4 bytes left, which the Feathers also reject.
+    if len(body) - offset < PANEL_COMMAND_LEN:
+        return None
+    return PanelCommand._make(PANEL_COMMAND.unpack_from(body, offset))
+
+
+def decode_group_command(body, offset=0):
+    if len(body) - offset < GROUP_COMMAND_LEN:
+        return None
+    return GroupCommand._make(GROUP_COMMAND.unpack_from(body, offset))
+
+
+def decode_multi_command(body):
+    # The PanelCommands of a multi-command frame, or None when body is not
+    # one this version understands.
+    header = decode_panel_command(body)
+    if header is None or header.action != ACTION_MULTI_COMMAND or header.group != MULTI_COMMAND_VERSION:
+        return None
+    if len(body) != (header.position + 1) * PANEL_COMMAND_LEN:
+        return None
+    return [decode_panel_command(body, (n + 1) * PANEL_COMMAND_LEN) for n in range(header.position)]
+
+
+def panel_command(action, group, position, reserved=0):
+    # Immutable payload for tables built once at import.
+    return PANEL_COMMAND.pack(action, group, position, reserved)
+
+
+def group_command(mask, action, group, position, reserved=0):
+    return GROUP_COMMAND.pack(mask, action, group, position, reserved)
+
+
+def multi_command(payloads):
+    header = PANEL_COMMAND.pack(ACTION_MULTI_COMMAND, MULTI_COMMAND_VERSION, len(payloads), 0)
+    return header + b"".join(payloads)
+
+
+def format_frame(dest, sender, ident, flags, body, rssi=None):
+    # Only for logging; kept out of the decode path.
+    prefix = f"RSSI {rssi} | " if rssi is not None else ""
+    return f"{prefix}to={dest} from={sender} id={ident} flags=0x{flags:02X} | body={bytes(body).hex(' ')}"
@@ -0,0 +1,196 @@
+# R2N2 command table shared by the GUI and the text menu
+#
+# Every radio command is declared once here with its destination node, its
+# 4-byte PanelCommand payload (built once at import), the optimistic state
+# change the GUI applies when it is sent, and the STEALTH code the Body
+# Feather reports when the same command comes from the STEALTH controller.
+# Priority and the state keys a command sets tell the radio queue what may
+# overtake or replace what while commands wait for their node.
+
+from collections import namedtuple
+
+from r2n2_codec import RH_BROADCAST_ADDRESS, group_command, panel_command
+
+
+PI_NODE = 99
+BODY_NODE = 10
+FRONT_NODE = 20
+REAR_NODE = 30
+DOME_NODE = 40
+
+# Priorities for the radio queue, lower goes first. A safety command
+# (closing panels) overtakes queued cosmetic ones (sounds, animations) and
+# is picked first when several nodes are ready.
+PRIORITY_SAFETY = 0
+PRIORITY_NORMAL = 1
+PRIORITY_COSMETIC = 2
+
+NODE_NAMES = {BODY_NODE: "Body", FRONT_NODE: "Front", REAR_NODE: "Rear", DOME_NODE: "Dome"}
+
+# Bit per node in a group command's node mask. The bit number is also the
+# node's reply slot (GROUP_NODE_BIT / GROUP_REPLY_SLOT in the .ino files).
+NODE_BITS = {BODY_NODE: 0x01, FRONT_NODE: 0x02, REAR_NODE: 0x04, DOME_NODE: 0x08}
+
+ACTION_SERVO_GROUP_MOVE = 2
+ACTION_DOME_ALL_OPEN = 5
+ACTION_DOME_ALL_CLOSE = 6
+ACTION_DOME_WAVE = 7
+ACTION_FRONT_ARM_FLAIL = 8
+ACTION_FRONT_CHARGE_TOGGLE = 9
+ACTION_FRONT_DATA_TOGGLE = 10
+ACTION_REAR_TOP_TOGGLE = 11
+ACTION_REAR_TOP_OPEN = 12
+ACTION_REAR_TOP_CLOSE = 13
+ACTION_STATUS_UPDATE = 0x40
+ACTION_STEALTH_SOUND = 0x30
+
+GROUP_ALL_SERVOS = 255
+SERVO_POS_OPEN = 1
+SERVO_POS_CLOSED = 2
+
+SOUND_BANKS = {
+    1: "General",
+    2: "Chatty",
+    3: "Sad",
+    4: "Burp",
+    5: "Whistle",
+    6: "Scream",
+    7: "Warning",
+    8: "Short",
+    9: "Leia",
+    10: "Imperial",
+    11: "Star Wars",
+    12: "Dance",
+    13: "Cantina",
+}
+
+# Text for the status byte of an ACTION_STATUS_UPDATE packet.
+STATUS_TEXT = {0: "triggered", SERVO_POS_OPEN: "open", SERVO_POS_CLOSED: "closed"}
+
+# State value that flips between "open" and "closed".
+TOGGLE = "toggle"
+
+# state is a tuple of (state key, new value) pairs. Group commands go to
+# RH_BROADCAST_ADDRESS and list the unicast commands they stand for in
+# members, which the radio falls back to for nodes that do not confirm.
+# The rest is what RadioWorker.send() takes, built once here:
+# radio_members are its (label, dest, payload, targets) member tuples,
+# targets the state keys the command moves, and toggle is set when it
+# flips them instead. The radio queue drops a waiting command whose
+# targets a newer one sets again, and never lets a command overtake one
+# that moves the same thing.
+Command = namedtuple(
+    "Command",
+    "name label dest payload state stealth members priority radio_members targets toggle",
+    defaults=((), PRIORITY_NORMAL, (), (), False),
+)
+
+COMMANDS = {}
+STEALTH_COMMANDS = {}
+SOUND_COMMANDS = {}
+
+
+def sound_label(bank):
+    return SOUND_BANKS.get(bank, f"Custom {bank}")
+
+
+def add_command(name, label, dest, payload, state=(), stealth=None, priority=PRIORITY_NORMAL):
+    state = tuple(state)
+    targets = tuple(key for key, value in state)
+    toggle = any(value == TOGGLE for key, value in state)
+    cmd = Command(name, label, dest, panel_command(*payload), state, stealth, (), priority, (), targets, toggle)
+    COMMANDS[name] = cmd
+    if stealth is not None:
+        STEALTH_COMMANDS[stealth] = cmd
+    return cmd
+
+
+def add_group_command(name, label, steps, payload, priority=PRIORITY_NORMAL):
+    members = tuple(COMMANDS[step] for step in steps)
+    mask = 0
+    for cmd in members:
+        mask |= NODE_BITS[cmd.dest]
+    state = tuple(item for cmd in members for item in cmd.state)
+    radio_members = tuple((cmd.label, cmd.dest, cmd.payload, cmd.targets) for cmd in members)
+    targets = tuple(target for cmd in members for target in cmd.targets)
+    toggle = any(cmd.toggle for cmd in members)
+    cmd = Command(
+        name, label, RH_BROADCAST_ADDRESS, group_command(mask, *payload), state, None, members, priority, radio_members, targets, toggle
+    )
+    COMMANDS[name] = cmd
+    return cmd
+
+
+def group_sequence(commands):
+    # The same steps with every complete set of group members replaced by
+    # the group command, at the position of its first member.
+    commands = list(commands)
+    for group in GROUP_COMMANDS:
+        members = COMMANDS[group].members
+        if not all(cmd in commands for cmd in members):
+            continue
+        at = min(commands.index(cmd) for cmd in members)
+        commands = [cmd for cmd in commands if cmd not in members]
+        commands.insert(at, COMMANDS[group])
+    return tuple(commands)
+
+
+def apply_command_state(state, cmd):
+    for key, value in cmd.state:
+        if value == TOGGLE:
+            state[key] = "open" if state[key] != "open" else "closed"
+        else:
+            state[key] = value
+
+
+FRONT_OPEN = (("front", "open"), ("charge_bay", "open"), ("data_panel", "open"))
+FRONT_CLOSED = (("front", "closed"), ("charge_bay", "closed"), ("data_panel", "closed"))
+REAR_OPEN = (("rear", "open"), ("rear_top", "open"))
+REAR_CLOSED = (("rear", "closed"), ("rear_top", "closed"))
+
+add_command("front_open", "Front Open", FRONT_NODE, (ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0), FRONT_OPEN, 0x10)
+add_command("front_close", "Front Close", FRONT_NODE, (ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0), FRONT_CLOSED, 0x11, PRIORITY_SAFETY)
+add_command("arm_flail", "Arm Flail", FRONT_NODE, (ACTION_FRONT_ARM_FLAIL, 0, 0, 0), (), 0x17, PRIORITY_COSMETIC)
+add_command("charge_bay_toggle", "Charge Bay Toggle", FRONT_NODE, (ACTION_FRONT_CHARGE_TOGGLE, 2, 0, 0), (("charge_bay", TOGGLE),), 0x18)
+add_command("data_panel_toggle", "Data Panel Toggle", FRONT_NODE, (ACTION_FRONT_DATA_TOGGLE, 6, 0, 0), (("data_panel", TOGGLE),), 0x19)
+
+add_command("rear_open", "Rear Open", REAR_NODE, (ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0), REAR_OPEN, 0x12)
+add_command("rear_close", "Rear Close", REAR_NODE, (ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0), REAR_CLOSED, 0x13, PRIORITY_SAFETY)
+add_command("rear_top_toggle", "Rear Top Toggle", REAR_NODE, (ACTION_REAR_TOP_TOGGLE, 2, 0, 0), (("rear_top", TOGGLE),), 0x26)
+add_command("rear_top_open", "Rear Top Open", REAR_NODE, (ACTION_REAR_TOP_OPEN, 2, SERVO_POS_OPEN, 0), (("rear_top", "open"),), 0x1B)
+add_command("rear_top_close", "Rear Top Close", REAR_NODE, (ACTION_REAR_TOP_CLOSE, 2, SERVO_POS_CLOSED, 0), (("rear_top", "closed"),), 0x1C, PRIORITY_SAFETY)
+
+add_command("dome_open", "Dome Open", DOME_NODE, (ACTION_DOME_ALL_OPEN, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0), (("dome", "open"),), 0x14)
+add_command("dome_close", "Dome Close", DOME_NODE, (ACTION_DOME_ALL_CLOSE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0), (("dome", "closed"),), 0x15, PRIORITY_SAFETY)
+add_command("dome_wave", "Dome Wave", DOME_NODE, (ACTION_DOME_WAVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0), (("dome", "wave"),), 0x16, PRIORITY_COSMETIC)
+
+for bank in SOUND_BANKS:
+    SOUND_COMMANDS[bank] = add_command(
+        f"sound_{bank}",
+        f"Sound {bank}: {sound_label(bank)}",
+        BODY_NODE,
+        (ACTION_STEALTH_SOUND, bank, 0, 0),
+        (("selected_sound", bank),),
+        priority=PRIORITY_COSMETIC,
+    )
+
+# The Front and Rear Feathers move all servos on ACTION_SERVO_GROUP_MOVE to
+# GROUP_ALL_SERVOS; the Dome maps it to its open all / close all.
+# Closing is the safety command, so it goes out ahead of anything queued.
+GROUP_COMMANDS = ("all_open", "all_close")
+add_group_command("all_open", "Open All", ("front_open", "rear_open", "dome_open"), (ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN))
+add_group_command("all_close", "Close All", ("dome_close", "rear_close", "front_close"), (ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED), PRIORITY_SAFETY)
+
+# Multi-command presets, sent in this order.
+SEQUENCES = {
+    name: tuple(COMMANDS[step] for step in steps)
+    for name, steps in {
+        "open_all": ("front_open", "rear_open", "dome_open"),
+        "close_all": ("dome_close", "rear_close", "front_close"),
+        "wake_up": ("sound_1", "dome_open"),
+        "warning_all_open": ("sound_7", "front_open", "rear_open", "dome_open"),
+    }.items()
+}
+
+# Same presets with one broadcast per group instead of a packet per node.
+GROUP_SEQUENCES = {name: group_sequence(commands) for name, commands in SEQUENCES.items()}
@@ -0,0 +1,85 @@
+# R2N2 listen-before-talk for the RPi5 controller
+#
+# The Feathers transmit whenever they have something to say, so a button
+# press can land in the middle of a STEALTH status burst from the Body and
+# both packets are lost. With carrier sense on, the radio worker reads the
+# RFM69 RSSI before each command and, while it is above the threshold,
+# backs off for a random number of slots that doubles with every busy read.
+# A Feather that just sent a packet usually has the next one of its burst
+# ready a few ms later, so the channel also counts as busy for a short
+# holdoff after the last packet heard.
+
+import random
+import statistics
+import time
+
+
+# Noise floor plus this much counts as someone on air.
+CSMA_MARGIN_DB = 10
+# Used until calibrate() has run, and as the lower limit after it.
+CSMA_THRESHOLD_DBM = -90
+CSMA_CALIBRATE_SAMPLES = 32
+CSMA_CALIBRATE_SECONDS = 0.002
+# One slot is a bit longer than a full 60 byte RFM69 frame at 250 kbps.
+CSMA_SLOT_SECONDS = 0.003
+CSMA_MAX_EXPONENT = 5
+# Busy reads before the command goes out anyway.
+CSMA_MAX_TRIES = 7
+CSMA_HOLDOFF_SECONDS = 0.005
+
+
+class CarrierSense:
+    def __init__(
+        self,
+        threshold=None,
+        margin=CSMA_MARGIN_DB,
+        slot=CSMA_SLOT_SECONDS,
+        max_exponent=CSMA_MAX_EXPONENT,
+        max_tries=CSMA_MAX_TRIES,
+        holdoff=CSMA_HOLDOFF_SECONDS,
+    ):
+        # threshold pins the level in dBm; None calibrates it from the
+        # noise floor.
+        self.fixed = threshold is not None
+        self.threshold = threshold if threshold is not None else CSMA_THRESHOLD_DBM
+        self.noise_floor = None
+        self.margin = margin
+        self.slot = slot
+        self.max_exponent = max_exponent
+        self.max_tries = max_tries
+        self.holdoff = holdoff
+
+        # Clear reads, busy reads (one backoff each), total time backed
+        # off, and commands sent on a busy channel after max_tries.
+        self.clear = 0
+        self.busy = 0
+        self.backoff_seconds = 0.0
+        self.forced = 0
+
+    def calibrate(self, read_rssi, samples=CSMA_CALIBRATE_SAMPLES, spacing=CSMA_CALIBRATE_SECONDS):
+        # The median of a few reads while listening. A packet going past
+        # moves a handful of them, not the median.
+        readings = []
+        for n in range(samples):
+            readings.append(read_rssi())
+            time.sleep(spacing)
+        self.noise_floor = statistics.median(readings)
+        if not self.fixed:
+            self.threshold = max(CSMA_THRESHOLD_DBM, self.noise_floor + self.margin)
+        return self.threshold
+
+    def check(self, rssi, tries, quiet_for=None):
+        # 0 when the command may go now, otherwise how long to back off.
+        # tries is how many busy reads this command has had already,
+        # quiet_for how long ago the last packet was heard.
+        if rssi <= self.threshold and (quiet_for is None or quiet_for >= self.holdoff):
+            self.clear += 1
+            return 0.0
+        if tries >= self.max_tries:
+            self.forced += 1
+            return 0.0
+
+        self.busy += 1
+        delay = self.slot * random.randint(1, 2 ** min(tries + 1, self.max_exponent))
+        self.backoff_seconds += delay
+        return delay
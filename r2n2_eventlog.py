@@ -0,0 +1,167 @@
+# R2N2 binary radio event log for the RPi5 controller
+#
+# Every TX and RX is written as a fixed 24 byte record into a memory-mapped
+# ring file, which costs a struct.pack_into() instead of a formatted print()
+# to the SD card. A background thread msyncs the map every few seconds.
+#
+# Decode after a show with:
+#   python3 r2n2_eventlog.py r2n2_events.bin          (pretty print)
+#   python3 r2n2_eventlog.py r2n2_events.bin --csv    (CSV to stdout)
+
+import csv
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+
+EVENT_LOG_MAGIC = b"R2EV"
+EVENT_LOG_VERSION = 1
+EVENT_LOG_CAPACITY = 65536
+EVENT_LOG_FLUSH_SECONDS = 2.0
+
+# magic, version, record size, capacity, next sequence number
+LOG_HEADER = struct.Struct("<4sHHII")
+# seq, wall time, event, node, id, flags, rssi, body length, first 4 body bytes
+LOG_RECORD = struct.Struct("<IdBBBBhB4sx")
+
+EVENT_TX = 1
+EVENT_RX = 2
+EVENT_TX_NOACK = 3
+EVENT_RX_DUP = 4
+EVENT_RX_DROP = 5
+
+EVENT_NAMES = {
+    EVENT_TX: "TX",
+    EVENT_RX: "RX",
+    EVENT_TX_NOACK: "NOACK",
+    EVENT_RX_DUP: "DUP",
+    EVENT_RX_DROP: "DROP",
+}
+
+
+class EventLog(threading.Thread):
+    def __init__(self, path, capacity=EVENT_LOG_CAPACITY, flush_seconds=EVENT_LOG_FLUSH_SECONDS):
+        super().__init__(name="eventlog", daemon=True)
+        self.path = path
+        self.flush_seconds = flush_seconds
+        size = LOG_HEADER.size + capacity * LOG_RECORD.size
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, record_size, old_capacity, next_seq = LOG_HEADER.unpack_from(self.map, 0)
+        if fresh or (magic, version, record_size, old_capacity) != (EVENT_LOG_MAGIC, EVENT_LOG_VERSION, LOG_RECORD.size, capacity):
+            self.map[:] = bytes(size)
+            next_seq = 1
+
+        # Keep appending after the previous run, so one file covers a show.
+        self.capacity = capacity
+        self.next_seq = next_seq
+        self.write_header()
+
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.stopping = threading.Event()
+
+    def write_header(self):
+        LOG_HEADER.pack_into(self.map, 0, EVENT_LOG_MAGIC, EVENT_LOG_VERSION, LOG_RECORD.size, self.capacity, self.next_seq)
+
+    def log(self, event, node, ident=0, flags=0, rssi=0, body=b""):
+        # Called from the radio and UI threads.
+        with self.lock:
+            seq = self.next_seq
+            offset = LOG_HEADER.size + (seq % self.capacity) * LOG_RECORD.size
+            LOG_RECORD.pack_into(
+                self.map, offset, seq, time.time(), event, node, ident, flags, rssi, len(body), bytes(body[:4])
+            )
+            self.next_seq = (seq + 1) & 0xFFFFFFFF or 1
+            self.dirty = True
+
+    def flush(self):
+        # The header's next sequence number is only a hint for the next run,
+        # so it is written here rather than on every record.
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            self.write_header()
+        self.map.flush()
+
+    def stop(self, timeout=1.0):
+        self.stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.flush()
+        self.map.close()
+
+    def run(self):
+        while not self.stopping.wait(self.flush_seconds):
+            self.flush()
+
+
+def open_event_log(path, capacity=EVENT_LOG_CAPACITY):
+    try:
+        return EventLog(path, capacity)
+    except (OSError, ValueError) as exc:
+        print(f"Event log unavailable ({exc}), not logging radio traffic")
+        return None
+
+
+def read_events(path):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, record_size, capacity, next_seq = LOG_HEADER.unpack_from(data, 0)
+    if magic != EVENT_LOG_MAGIC or version != EVENT_LOG_VERSION or record_size != LOG_RECORD.size:
+        raise ValueError(f"{path} is not an R2N2 event log")
+
+    records = []
+    for slot in range(capacity):
+        record = LOG_RECORD.unpack_from(data, LOG_HEADER.size + slot * LOG_RECORD.size)
+        if record[0]:
+            records.append(record)
+    records.sort()
+    return records
+
+
+def format_event(record):
+    seq, stamp, event, node, ident, flags, rssi, length, body = record
+    millis = round(stamp * 1000)
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(millis // 1000)) + f".{millis % 1000:03d}"
+    name = EVENT_NAMES.get(event, str(event))
+    rssi_text = str(rssi) if event in (EVENT_RX, EVENT_RX_DUP, EVENT_RX_DROP) else ""
+    body_text = body[:min(length, 4)].hex(" ") + (" ..." if length > 4 else "")
+    return f"{seq:8d} {when} {name:5s} node {node:3d} id {ident:3d} flags 0x{flags:02X} rssi {rssi_text:>4s} | {body_text}"
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if not args or args[0] in ("-h", "--help"):
+        print("usage: r2n2_eventlog.py LOGFILE [--csv]")
+        return 2
+
+    records = read_events(args[0])
+    if "--csv" in args[1:]:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["seq", "time", "event", "node", "id", "flags", "rssi", "length", "body"])
+        for seq, stamp, event, node, ident, flags, rssi, length, body in records:
+            writer.writerow(
+                [seq, f"{stamp:.3f}", EVENT_NAMES.get(event, event), node, ident, flags, rssi, length, body[:min(length, 4)].hex()]
+            )
+    else:
+        for record in records:
+            print(format_event(record))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
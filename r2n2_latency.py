@@ -0,0 +1,56 @@
+# R2N2 command latency tracking for the RPi5 controller
+#
+# Every command is timed in three stages:
+#   input  keypress or tap -> command queued for the radio (UI thread)
+#   queue  queued -> rfm69.send() returned (radio scheduling and SPI)
+#   reply  on air -> RadioHead ACK, or the node's next packet (the Feather)
+# Each (node, command, stage) keeps its last LATENCY_SAMPLES timings in a
+# ring, so the percentiles on the Status page describe recent behaviour.
+
+from collections import deque
+
+
+LATENCY_SAMPLES = 128
+LATENCY_STAGES = ("input", "queue", "reply")
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered, pct):
+    # Nearest-rank percentile of an already sorted list.
+    if not ordered:
+        return None
+    rank = max(1, -(-pct * len(ordered) // 100))
+    return ordered[rank - 1]
+
+
+class LatencyTracker:
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self.rings = {}
+
+    def add(self, node, label, stage, seconds):
+        key = (node, label, stage)
+        ring = self.rings.get(key)
+        if ring is None:
+            ring = self.rings[key] = deque(maxlen=self.samples)
+        ring.append(seconds)
+
+    def clear(self):
+        self.rings.clear()
+
+    def stage_summary(self, node, label, stage):
+        # (count, p50, p95, p99) in seconds, or None without samples.
+        ring = self.rings.get((node, label, stage))
+        if not ring:
+            return None
+        ordered = sorted(ring)
+        return (len(ordered),) + tuple(percentile(ordered, pct) for pct in LATENCY_PERCENTILES)
+
+    def summary(self):
+        # One (node, label, {stage: stage_summary}) row per command seen,
+        # ordered by node then label.
+        commands = sorted({(node, label) for node, label, stage in self.rings})
+        return [
+            (node, label, {stage: self.stage_summary(node, label, stage) for stage in LATENCY_STAGES})
+            for node, label in commands
+        ]
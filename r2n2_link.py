@@ -0,0 +1,169 @@
+# R2N2 per-node radio link quality for the RPi5 controller
+#
+# The radio worker records every packet it hears and every command it
+# finishes; the UI reads summaries for the header and the Status page.
+# Each node keeps fixed-size array rings with running sums, so recording and
+# summarising cost the same an hour into a show as they do at start-up.
+
+import math
+import threading
+
+from array import array
+from collections import namedtuple
+
+from r2n2_codec import RH_FLAGS_ACK, RH_FLAGS_RETRY
+
+
+LINK_WINDOW = 64
+# A jump in a node's packet id bigger than this is taken as the Feather
+# restarting, not as that many lost packets.
+LINK_MAX_ID_GAP = 32
+
+LinkSummary = namedtuple(
+    "LinkSummary",
+    "node name packets rssi rssi_avg loss rx_retry_rate tx_attempts tx_fail_rate gap_avg gap_jitter",
+)
+
+
+class RollingWindow:
+    # Last `size` values in an array ring plus a running sum and sum of
+    # squares. The sums are rebuilt on each wrap so float error cannot pile up.
+    def __init__(self, size, typecode="d"):
+        self.values = array(typecode, [0]) * size
+        self.size = size
+        self.count = 0
+        self.index = 0
+        self.total = 0
+        self.squares = 0
+
+    def add(self, value):
+        if self.count == self.size:
+            old = self.values[self.index]
+            self.total -= old
+            self.squares -= old * old
+        else:
+            self.count += 1
+
+        self.values[self.index] = value
+        self.total += value
+        self.squares += value * value
+
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+            self.total = sum(self.values)
+            self.squares = sum(v * v for v in self.values)
+
+    def last(self):
+        if not self.count:
+            return None
+        return self.values[self.index - 1]
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def stdev(self):
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return math.sqrt(max(0.0, self.squares / self.count - mean * mean))
+
+
+class NodeLink:
+    def __init__(self, node, name, window=LINK_WINDOW):
+        self.node = node
+        self.name = name
+        self.packets = 0
+        self.last_ident = None
+        self.last_at = None
+
+        self.rssi = RollingWindow(window, "d")
+        self.gaps = RollingWindow(window, "d")
+        # Id steps per new packet from the node: 1 means nothing was missed.
+        self.id_steps = RollingWindow(window, "B")
+        self.rx_retries = RollingWindow(window, "B")
+        # Attempts and failures per reliable command we sent to the node.
+        self.tx_attempts = RollingWindow(window, "B")
+        self.tx_failed = RollingWindow(window, "B")
+
+    def record_rx(self, ident, flags, rssi, now):
+        self.packets += 1
+        self.rssi.add(rssi)
+        if self.last_at is not None:
+            self.gaps.add(now - self.last_at)
+        self.last_at = now
+
+        # ACKs carry our id back, so only the node's own packets say
+        # anything about what we missed.
+        if flags & RH_FLAGS_ACK:
+            return
+
+        if self.last_ident is None:
+            step = 1
+        else:
+            step = (ident - self.last_ident) & 0xFF
+            if step == 0:
+                # Retry of a packet we already have.
+                return
+            if step > LINK_MAX_ID_GAP:
+                step = 1
+        self.last_ident = ident
+        self.id_steps.add(step)
+        self.rx_retries.add(1 if flags & RH_FLAGS_RETRY else 0)
+
+    def record_tx(self, attempts, acked):
+        if acked is None:
+            return
+        self.tx_attempts.add(min(attempts, 255))
+        self.tx_failed.add(0 if acked else 1)
+
+    def summary(self):
+        loss = None
+        if self.id_steps.count:
+            loss = 1.0 - self.id_steps.count / self.id_steps.total
+        return LinkSummary(
+            self.node,
+            self.name,
+            self.packets,
+            self.rssi.last(),
+            self.rssi.mean(),
+            loss,
+            self.rx_retries.mean(),
+            self.tx_attempts.mean(),
+            self.tx_failed.mean(),
+            self.gaps.mean(),
+            self.gaps.stdev(),
+        )
+
+
+class LinkTracker:
+    def __init__(self, nodes, window=LINK_WINDOW):
+        # nodes maps node address to display name; other senders are
+        # tracked too, named by address.
+        self.window = window
+        self.lock = threading.Lock()
+        self.links = {node: NodeLink(node, name, window) for node, name in nodes.items()}
+
+    def link_for(self, node):
+        link = self.links.get(node)
+        if link is None:
+            link = self.links[node] = NodeLink(node, str(node), self.window)
+        return link
+
+    def record_rx(self, sender, ident, flags, rssi, now):
+        with self.lock:
+            self.link_for(sender).record_rx(ident, flags, rssi, now)
+
+    def record_tx(self, dest, attempts, acked):
+        with self.lock:
+            self.link_for(dest).record_tx(attempts, acked)
+
+    def summary(self, node):
+        with self.lock:
+            return self.link_for(node).summary()
+
+    def summaries(self):
+        with self.lock:
+            return [link.summary() for node, link in sorted(self.links.items())]
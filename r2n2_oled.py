@@ -0,0 +1,351 @@
+# R2N2 status OLED writer for the RPi5 controller
+#
+# oled() calls only record the wanted text. A background thread pushes it to
+# the SSD1306, so radio TX and the UI never wait on the I2C bus.
+
+import threading
+
+from PIL import Image, ImageDraw
+
+
+OLED_LINE_CHARS = 21
+OLED_LINE_HEIGHT = 10
+OLED_GLYPHS = "".join(chr(c) for c in range(32, 127))
+OLED_SET_COL_ADDR = 0x21
+OLED_SET_PAGE_ADDR = 0x22
+OLED_SELF_TEST = ("RX from 10 RSSI -42", "STEALTH RX Dome Open", "Sound 13: Cantina id 7")
+
+
+def font_advance(font, ch):
+    if hasattr(font, "getlength"):
+        return font.getlength(ch)
+    return font.getsize(ch)[0]
+
+
+class GlyphRenderer:
+    # Renders status text straight into the SSD1306 framebuffer layout: one
+    # byte per column per 8-pixel page, top pixel in the low bit.
+    #
+    # Each glyph is rasterized once through PIL, so the result matches
+    # ImageDraw.text() for fixed-advance bitmap fonts like the default 5x7
+    # one. Fonts where that does not hold raise ValueError.
+    def __init__(self, font, width=128, height=32, rows=3, line_height=OLED_LINE_HEIGHT):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.row_y = [row * line_height for row in range(rows)]
+
+        # Column accumulator: one int per x holding all rows, bit y = pixel y.
+        self.columns = [0] * width
+
+        self.advance = {}
+        for ch in OLED_GLYPHS:
+            advance = font_advance(font, ch)
+            if advance != int(advance):
+                raise ValueError(f"font has fractional advance for {ch!r}")
+            self.advance[ch] = int(advance)
+
+        self.scratch = Image.new("1", (40, height))
+        self.scratch_draw = ImageDraw.Draw(self.scratch)
+        self.font = font
+
+        # Glyphs are drawn after a blank space: PIL clips the left overhang
+        # of the first character on a line but keeps it for the others.
+        space = self.advance[" "]
+        shapes = {}
+        for ch in OLED_GLYPHS:
+            shapes[ch] = {x - space: value for x, value in self.text_columns(" " + ch).items()}
+
+        # PIL pastes each glyph cell as an opaque box, so an overhanging
+        # column also erases what the previous glyph put there. Find which
+        # pixels each glyph erases by drawing it after a few predecessors
+        # that between them light every pixel a glyph can leave behind.
+        predecessors = self.cover_set(shapes)
+        self.glyphs = {}
+        for ch in OLED_GLYPHS:
+            erase = {}
+            for prev in predecessors:
+                after = self.text_columns(" " + prev + ch)
+                for x, value in shapes[prev].items():
+                    gone = value & ~after.get(x + space, 0)
+                    if gone:
+                        dx = x - self.advance[prev]
+                        erase[dx] = erase.get(dx, 0) | gone
+
+            cols = sorted(set(shapes[ch]) | set(erase))
+            self.glyphs[ch] = tuple(
+                (dx, shapes[ch].get(dx, 0), erase.get(dx, 0) | shapes[ch].get(dx, 0)) for dx in cols
+            )
+
+        self.scratch = None
+        self.scratch_draw = None
+
+        for row, line in enumerate(OLED_SELF_TEST):
+            lines = ["", "", ""]
+            lines[row % rows] = line
+            if bytes(self.render(lines)) != bytes(pil_framebuffer(font, lines, width, height)):
+                raise ValueError("glyph output does not match PIL for this font")
+
+    def text_columns(self, text):
+        draw = self.scratch_draw
+        draw.rectangle((0, 0, self.scratch.width - 1, self.height - 1), fill=0)
+        draw.text((0, 0), text, font=self.font, fill=255)
+        pixels = self.scratch.load()
+
+        cols = {}
+        for x in range(self.scratch.width):
+            value = 0
+            for y in range(self.height):
+                if pixels[x, y]:
+                    value |= 1 << y
+            if value:
+                cols[x] = value
+        return cols
+
+    def cover_set(self, shapes):
+        # Greedy pick of glyphs whose right-hand columns (the ones the next
+        # glyph can overlap) together light every possible pixel.
+        tails = {}
+        for ch, cols in shapes.items():
+            tail = {}
+            for x, value in cols.items():
+                dx = x - self.advance[ch]
+                if dx >= -2:
+                    tail[dx] = value
+            tails[ch] = tail
+
+        wanted = {}
+        for tail in tails.values():
+            for dx, value in tail.items():
+                wanted[dx] = wanted.get(dx, 0) | value
+
+        chosen = []
+        while any(wanted.values()):
+            best = max(
+                OLED_GLYPHS,
+                key=lambda ch: sum(bin(value & wanted.get(dx, 0)).count("1") for dx, value in tails[ch].items()),
+            )
+            chosen.append(best)
+            for dx, value in tails[best].items():
+                wanted[dx] = wanted.get(dx, 0) & ~value
+        return chosen
+
+    def supports(self, lines):
+        return all(ch in self.advance for line in lines for ch in line)
+
+    def render(self, lines, buf=None):
+        if buf is None:
+            buf = bytearray(self.width * self.pages)
+
+        columns = self.columns
+        width = self.width
+        visible = (1 << self.height) - 1
+        for x in range(width):
+            columns[x] = 0
+
+        for y, line in zip(self.row_y, lines):
+            # Each line is built on its own, then ORed in, just like
+            # separate draw.text() calls.
+            line_cols = {}
+            pen = 0
+            for ch in line:
+                for dx, value, box in self.glyphs[ch]:
+                    x = pen + dx
+                    if 0 <= x < width:
+                        line_cols[x] = (line_cols.get(x, 0) & ~box) | value
+                pen += self.advance[ch]
+                if pen > width:
+                    break
+            for x, value in line_cols.items():
+                columns[x] |= (value << y) & visible
+
+        for page in range(self.pages):
+            shift = page * 8
+            base = page * width
+            for x in range(width):
+                buf[base + x] = (columns[x] >> shift) & 0xFF
+        return buf
+
+
+def pil_framebuffer(font, lines, width=128, height=32):
+    # The original path: draw with PIL, then convert pixel by pixel into
+    # SSD1306 page format the way adafruit_framebuf's image() does.
+    image = Image.new("1", (width, height))
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        draw.text((0, row * OLED_LINE_HEIGHT), line, font=font, fill=255)
+
+    buf = bytearray(width * (height // 8))
+    pixels = image.load()
+    for x in range(width):
+        for y in range(height):
+            if pixels[x, y]:
+                buf[(y >> 3) * width + x] |= 1 << (y & 7)
+    return buf
+
+
+class OledWriter(threading.Thread):
+    def __init__(self, display, font, renderer="glyph", partial=True):
+        super().__init__(name="oled", daemon=True)
+        self.display = display
+        self.font = font
+
+        # One image and one draw context, reused for every frame.
+        self.image = Image.new("1", (display.width, display.height))
+        self.draw = ImageDraw.Draw(self.image)
+
+        # "glyph" writes straight into display.buf, "pil" always goes through
+        # ImageDraw and display.image().
+        self.glyph_renderer = None
+        if renderer == "glyph":
+            try:
+                self.glyph_renderer = GlyphRenderer(font, display.width, display.height)
+            except ValueError as exc:
+                print(f"OLED glyph renderer unavailable ({exc}), using PIL")
+
+        # Copy of what the panel RAM holds, so show() can send only the
+        # pages/columns that changed. None means unknown: send everything.
+        # Needs the I2C driver in horizontal addressing mode.
+        self.partial = partial and hasattr(display, "i2c_device") and not getattr(display, "page_addressing", False)
+        self.shadow = None
+        self.window = None
+        if self.partial:
+            self.window = bytearray(1 + len(display.buf))
+            self.window[0] = 0x40
+        self.i2c_bytes = 0
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.wanted = None
+        self.shown = None
+        self.stopping = False
+
+    def write(self, line1="", line2="", line3=""):
+        # Latest wins: a newer write replaces one that has not been shown yet.
+        lines = (line1[:OLED_LINE_CHARS], line2[:OLED_LINE_CHARS], line3[:OLED_LINE_CHARS])
+        with self.lock:
+            self.wanted = lines
+            self.changed.notify_all()
+
+    def flush(self, timeout=1.0):
+        # Wait until the last written text is on the display, e.g. before
+        # shutting the Pi down.
+        if not self.is_alive():
+            if self.wanted != self.shown:
+                self.render(self.wanted)
+                self.shown = self.wanted
+            return
+        with self.lock:
+            self.changed.wait_for(lambda: self.shown == self.wanted, timeout)
+
+    def stop(self, timeout=1.0):
+        self.flush(timeout)
+        with self.lock:
+            self.stopping = True
+            self.changed.notify_all()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.changed.wait_for(lambda: self.stopping or self.wanted != self.shown)
+                if self.stopping:
+                    return
+                lines = self.wanted
+
+            try:
+                self.render(lines)
+            except OSError as exc:
+                # An I2C glitch. Drop the shadow so the next write repaints
+                # the whole panel, rather than retrying this frame in a loop.
+                print(f"OLED write failed: {exc}")
+                self.shadow = None
+
+            with self.lock:
+                self.shown = lines
+                self.changed.notify_all()
+
+    def render(self, lines):
+        if lines is None:
+            return
+
+        if self.glyph_renderer is not None and self.glyph_renderer.supports(lines):
+            self.glyph_renderer.render(lines, self.display.buf)
+            self.show()
+            return
+
+        self.draw.rectangle((0, 0, self.display.width - 1, self.display.height - 1), fill=0)
+        for row, line in enumerate(lines):
+            self.draw.text((0, row * OLED_LINE_HEIGHT), line, font=self.font, fill=255)
+        self.display.image(self.image)
+        self.show()
+
+    def dirty_window(self):
+        # Smallest page/column box that covers every byte that changed.
+        display = self.display
+        buf = display.buf
+        shadow = self.shadow
+        width = display.width
+
+        pages = []
+        x0 = width
+        x1 = -1
+        for page in range(display.height // 8):
+            base = page * width
+            if buf[base:base + width] == shadow[base:base + width]:
+                continue
+            pages.append(page)
+            left = 0
+            while buf[base + left] == shadow[base + left]:
+                left += 1
+            right = width - 1
+            while buf[base + right] == shadow[base + right]:
+                right -= 1
+            x0 = min(x0, left)
+            x1 = max(x1, right)
+
+        if not pages:
+            return None
+        return pages[0], pages[-1], x0, x1
+
+    def show(self):
+        display = self.display
+        if not self.partial or self.shadow is None:
+            display.show()
+            self.i2c_bytes += 1 + display.width * display.height // 8
+            self.shadow = bytearray(display.buf) if self.partial else None
+            return
+
+        window = self.dirty_window()
+        if window is None:
+            return
+        page0, page1, x0, x1 = window
+
+        # Narrow panels sit in the middle of the 128 column controller RAM.
+        offset = (128 - display.width) // 2 if display.width != 128 else 0
+        try:
+            for cmd in (OLED_SET_COL_ADDR, x0 + offset, x1 + offset, OLED_SET_PAGE_ADDR, page0, page1):
+                display.write_cmd(cmd)
+
+            # Horizontal addressing wraps at x1 back to x0 on the next page,
+            # so the window goes out as one data transfer.
+            buf = display.buf
+            width = display.width
+            span = x1 - x0 + 1
+            end = 1
+            for page in range(page0, page1 + 1):
+                base = page * width
+                self.window[end:end + span] = buf[base + x0:base + x1 + 1]
+                end += span
+            with display.i2c_device:
+                display.i2c_device.write(self.window, end=end)
+        except OSError:
+            # The panel may hold anything now; resend it all next time.
+            self.shadow = None
+            raise
+
+        self.i2c_bytes += 6 * 2 + end
+        for page in range(page0, page1 + 1):
+            base = page * width
+            self.shadow[base + x0:base + x1 + 1] = buf[base + x0:base + x1 + 1]
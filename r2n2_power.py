@@ -0,0 +1,106 @@
+# R2N2 adaptive per-node TX power for the RPi5 controller
+#
+# The Front and Rear panels sit next to the operator, the Dome further away.
+# Each node starts at the default power and steps down while its commands are
+# ACKed first time with link margin to spare, and back up as soon as it needs
+# a retry or misses an ACK. Retries of a command also go out louder.
+
+from collections import deque
+
+from r2n2_codec import RH_BROADCAST_ADDRESS
+
+
+# RFM69HCW high power range in the adafruit driver is -2..20 dBm.
+TX_POWER_MIN = 2
+TX_POWER_MAX = 20
+TX_POWER_STEP = 2
+# The Feathers call rf69.setTxPower(14, true), so the RSSI we hear from a
+# node plus our power difference estimates what the node hears from us.
+NODE_TX_POWER = 14
+# Roughly the RFM69 sensitivity at RadioHead's default GFSK 250 kbps.
+RX_SENSITIVITY_DBM = -85
+TARGET_MARGIN_DB = 20
+# First-try ACKs in a row before a node is allowed one step down.
+STEP_DOWN_AFTER = 8
+
+
+class TxPowerController:
+    def __init__(
+        self,
+        default,
+        min_dbm=TX_POWER_MIN,
+        max_dbm=TX_POWER_MAX,
+        step=TX_POWER_STEP,
+        overrides=None,
+        target_margin=TARGET_MARGIN_DB,
+        step_down_after=STEP_DOWN_AFTER,
+        log=print,
+    ):
+        self.default = max(min_dbm, min(max_dbm, default))
+        self.min_dbm = min_dbm
+        self.max_dbm = max_dbm
+        self.step = step
+        # Nodes pinned to a fixed power, e.g. {40: 20} for the Dome.
+        self.overrides = dict(overrides or {})
+        self.target_margin = target_margin
+        self.step_down_after = step_down_after
+        self.log = log
+
+        self.power = {}
+        self.clean = {}
+        # (node, old dBm, new dBm, reason) for the Status page.
+        self.decisions = deque(maxlen=32)
+
+    def base_power(self, dest):
+        if dest in self.overrides:
+            return self.overrides[dest]
+        return self.power.get(dest, self.default)
+
+    def power_for(self, dest, attempt=1):
+        if dest == RH_BROADCAST_ADDRESS:
+            # Has to reach the node that needs the most, pinned ones included.
+            return max([self.default] + [self.base_power(node) for node in self.power] + list(self.overrides.values()))
+        power = self.base_power(dest)
+        if dest in self.overrides:
+            return power
+        return min(self.max_dbm, power + self.step * (attempt - 1))
+
+    def margin(self, power, rssi):
+        if rssi is None:
+            return None
+        return rssi + (power - NODE_TX_POWER) - RX_SENSITIVITY_DBM
+
+    def on_result(self, dest, attempts, acked, rssi=None):
+        # Called once per finished command. acked is None when the command
+        # was not sent reliably, which says nothing about the link.
+        if acked is None or dest in self.overrides or dest == RH_BROADCAST_ADDRESS:
+            return
+
+        power = self.base_power(dest)
+        new = power
+        reason = None
+
+        if not acked:
+            new = self.max_dbm
+            reason = "no ACK"
+        elif attempts > 1:
+            new = min(self.max_dbm, power + self.step)
+            reason = f"ACK after {attempts} attempts"
+        else:
+            self.clean[dest] = self.clean.get(dest, 0) + 1
+            margin = self.margin(power, rssi)
+            if (
+                self.clean[dest] >= self.step_down_after
+                and margin is not None
+                and margin - self.step >= self.target_margin
+            ):
+                new = max(self.min_dbm, power - self.step)
+                reason = f"margin {margin:.0f} dB"
+
+        if new != power or reason == "no ACK":
+            self.clean[dest] = 0
+        if new != power:
+            self.power[dest] = new
+            self.decisions.append((dest, power, new, reason))
+            if self.log is not None:
+                self.log(f"TX power node {dest}: {power} -> {new} dBm ({reason})")
@@ -0,0 +1,824 @@
+# R2N2 radio worker thread for the RPi5 controller
+#
+# The worker owns the RFM69 instance. The UI thread only enqueues commands
+# and drains received packets, so radio timing never depends on the frame rate.
+
+import queue
+import random
+import threading
+import time
+
+from collections import OrderedDict, deque, namedtuple
+from itertools import islice
+
+from r2n2_codec import (
+    MULTI_COMMAND_MAX,
+    PANEL_COMMAND_LEN,
+    RH_ACK_PAYLOAD,
+    RH_BROADCAST_ADDRESS,
+    RH_FLAGS_ACK,
+    RH_FLAGS_RETRY,
+    decode_frame,
+    format_frame,
+    multi_command,
+)
+from r2n2_commands import PRIORITY_NORMAL, PRIORITY_SAFETY
+from r2n2_eventlog import EVENT_RX, EVENT_RX_DROP, EVENT_RX_DUP, EVENT_TX, EVENT_TX_NOACK
+
+
+RX_POLL_SECONDS = 0.01
+RX_DRAIN_BUDGET_SECONDS = 0.005
+RX_QUEUE_SIZE = 64
+
+ACK_TIMEOUT_SECONDS = 0.2
+DEDUP_WINDOW_SECONDS = 3.0
+# Feathers confirm a group command in reply slots of GROUP_REPLY_SLOT_MS,
+# GROUP_REPLY_SLOTS of them, then all start moving at the end of the window.
+GROUP_REPLY_WINDOW_SECONDS = 4 * 0.005
+# Commands for a node that takes multi-command frames wait this long after
+# being queued, so the rest of a sequence can join them in one frame.
+AGGREGATE_WINDOW_SECONDS = 0.01
+
+# Commands waiting per node before the least urgent one is dropped.
+TX_QUEUE_LIMIT = 16
+
+# Adafruit RFM69 bonnet wires DIO0 (PayloadReady while listening) to GPIO22.
+# The Pi 5 header is gpiochip0 on current kernels, gpiochip4 on older ones.
+DIO0_GPIO_CHIP = "/dev/gpiochip0"
+DIO0_GPIO_LINE = 22
+# RegOpMode mode bits while the RFM69 is listening.
+RF69_RX_MODE = 0b100
+
+TxCommand = namedtuple(
+    "TxCommand",
+    "label dest payload ident on_done queued_at reliable attempt members priority targets toggle",
+    defaults=(False, 1, None, PRIORITY_NORMAL, (), False),
+)
+# members holds a TxCommand per node of a group command, or per command
+# packed into a multi-command frame. Results are reported per member, as if
+# each had been sent on its own. targets are the panels (state keys) the
+# command moves; see enqueue() for how they replace and order commands.
+# acked is None for fire-and-forget commands; done_at is when the ACK came
+# in or the retries ran out.
+TxResult = namedtuple("TxResult", "cmd ok sent_at acked done_at", defaults=(None, None))
+RxPacket = namedtuple("RxPacket", "dest sender ident flags body rssi stamp")
+
+
+def overlaps(a, b):
+    return not set(a.targets).isdisjoint(b.targets)
+
+
+class PollingReceiver:
+    # Fallback backend: the driver polls the IRQ flags over SPI until a
+    # packet shows up or the timeout runs out.
+    def __init__(self, rfm69):
+        self.rfm69 = rfm69
+
+    def receive(self, timeout):
+        return self.rfm69.receive(timeout=timeout, with_header=True)
+
+    def close(self):
+        pass
+
+
+class Dio0Receiver:
+    # Sleeps in the kernel until DIO0 rises, then reads the FIFO once.
+    # No SPI traffic at all while the channel is quiet.
+    def __init__(self, rfm69, line):
+        self.rfm69 = rfm69
+        self.line = line
+        # adafruit_rfm69 leaves the chip in standby after init, and DIO0
+        # only signals PayloadReady in RX mode.
+        rfm69.listen()
+
+    def receive(self, timeout):
+        # Anything that leaves the driver in standby (a send without
+        # keep_listening, reading the temperature) would stop DIO0 too.
+        if self.rfm69.operation_mode != RF69_RX_MODE:
+            self.rfm69.listen()
+        if not self.line.wait(timeout):
+            return None
+        return self.rfm69.receive(timeout=0, with_header=True)
+
+    def close(self):
+        self.line.close()
+
+
+class GpiodLine:
+    # Rising-edge events from one GPIO line. Works with both the libgpiod
+    # v2 bindings (pip gpiod) and the v1 bindings shipped with Bookworm.
+    def __init__(self, chip_path=DIO0_GPIO_CHIP, offset=DIO0_GPIO_LINE, consumer="r2n2-rfm69-dio0"):
+        import gpiod
+
+        self.request = None
+        self.line = None
+
+        if hasattr(gpiod, "request_lines"):
+            from gpiod.line import Edge
+
+            self.request = gpiod.request_lines(
+                chip_path,
+                consumer=consumer,
+                config={offset: gpiod.LineSettings(edge_detection=Edge.RISING)},
+            )
+        else:
+            chip = gpiod.Chip(chip_path)
+            self.line = chip.get_line(offset)
+            self.line.request(consumer=consumer, type=gpiod.LINE_REQ_EV_RISING_EDGE)
+
+    def wait(self, timeout):
+        if self.request is not None:
+            if not self.request.wait_edge_events(timeout):
+                return False
+            self.request.read_edge_events()
+            return True
+
+        seconds = int(timeout)
+        if not self.line.event_wait(sec=seconds, nsec=int((timeout - seconds) * 1e9)):
+            return False
+        self.line.event_read()
+        return True
+
+    def close(self):
+        if self.request is not None:
+            self.request.release()
+        else:
+            self.line.release()
+
+
+class FakeDio0Line:
+    # Stand-in for GpiodLine when testing off the Pi: call trigger() after
+    # putting a packet in a fake radio to simulate the PayloadReady edge.
+    def __init__(self):
+        self.edge = threading.Event()
+
+    def trigger(self):
+        self.edge.set()
+
+    def wait(self, timeout):
+        if not self.edge.wait(timeout):
+            return False
+        self.edge.clear()
+        return True
+
+    def close(self):
+        pass
+
+
+def make_receiver(rfm69, backend="poll", chip_path=DIO0_GPIO_CHIP, offset=DIO0_GPIO_LINE):
+    if backend == "dio0":
+        try:
+            return Dio0Receiver(rfm69, GpiodLine(chip_path, offset))
+        except Exception as exc:
+            print(f"DIO0 receive unavailable ({exc}), falling back to polling")
+    return PollingReceiver(rfm69)
+
+
+class RadioWorker(threading.Thread):
+    def __init__(
+        self,
+        rfm69,
+        node,
+        node_gap=0.15,
+        tx_gap=0.02,
+        node_gaps=None,
+        rx_drain=True,
+        rx_budget=RX_DRAIN_BUDGET_SECONDS,
+        ack_retries=0,
+        ack_timeout=ACK_TIMEOUT_SECONDS,
+        dedup_window=DEDUP_WINDOW_SECONDS,
+        receiver=None,
+        trace=True,
+        event_log=None,
+        link=None,
+        power=None,
+        aggregate_nodes=(),
+        aggregate_window=AGGREGATE_WINDOW_SECONDS,
+        airtime=None,
+        csma=None,
+    ):
+        super().__init__(name="radio", daemon=True)
+        self.rfm69 = rfm69
+        self.node = node
+        self.receiver = receiver or PollingReceiver(rfm69)
+
+        # Per-packet TX/RX lines on stdout. Off skips the formatting too.
+        # event_log is an r2n2_eventlog.EventLog that records every packet.
+        self.trace = trace
+        self.event_log = event_log
+
+        # r2n2_link.LinkTracker fed with every packet heard and every
+        # finished command.
+        self.link = link
+
+        # r2n2_power.TxPowerController choosing each node's TX power from its
+        # ACKs and RSSI. tx_power caches what the radio is set to, since the
+        # driver's getter reads registers over SPI.
+        self.power = power
+        self.tx_power = None
+
+        # r2n2_airtime.AirtimeBudget charged with every packet on air. Once
+        # the Pi has used its share of the window, ordinary commands wait;
+        # safety commands, retries and ACKs always go. paced holds the ids
+        # of queue heads held back for budget; tx_paced counts those sent.
+        self.airtime = airtime
+        self.paced = set()
+        self.tx_paced = 0
+
+        # r2n2_csma.CarrierSense: read the RSSI before each command and back
+        # off while someone else is on air. ACKs go straight out, the node
+        # is waiting for them. ack_timeouts counts commands that heard no
+        # ACK in time, mostly collisions under load, with or without it.
+        self.csma = csma
+        self.csma_tries = 0
+        self.ack_timeouts = 0
+        self.last_heard_at = None
+
+        # A Feather is busy moving servos right after a command, so packets
+        # to the same node are spaced by node_gap. Different nodes only need
+        # the short tx_gap between them and can interleave.
+        self.node_gap = node_gap
+        self.node_gaps = dict(node_gaps or {})
+        self.tx_gap = tx_gap
+        self.rx_drain = rx_drain
+        self.rx_budget = rx_budget
+
+        # Nodes whose firmware takes multi-command frames. Their queued
+        # commands are packed into one frame per send.
+        self.aggregate_nodes = frozenset(aggregate_nodes)
+        self.aggregate_window = aggregate_window
+
+        # ack_retries > 0 makes send() wait for a RadioHead ACK by default.
+        self.ack_retries = ack_retries
+        self.ack_timeout = ack_timeout
+        self.dedup_window = dedup_window
+        self.awaiting = {}
+        # Nodes that have not yet confirmed the group command in flight.
+        self.group_pending = set()
+        self.seen = OrderedDict()
+        self.outcomes = {}
+
+        self.tx_queue = queue.Queue()
+        self.tx_done = queue.Queue()
+        self.rx_queue = queue.Queue(maxsize=RX_QUEUE_SIZE)
+
+        # Totals since start, plus (handled, dropped) for the most recent pass.
+        self.rx_handled = 0
+        self.rx_dropped = 0
+        self.last_drain = (0, 0)
+
+        self.pending = {}
+        # Commands waiting in pending, the most there have been, and how many
+        # were superseded (coalesced) or pushed out by a full queue (dropped).
+        self.tx_depth = 0
+        self.tx_peak_depth = 0
+        self.tx_coalesced = 0
+        self.tx_dropped = 0
+        self.node_ready_at = {}
+        self.next_tx_at = 0.0
+
+        # Called from the worker thread whenever something lands in
+        # rx_queue or tx_done, so the UI can sleep until there is work.
+        self.on_event = None
+
+        self.msg_id = 1
+        self.id_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def next_id(self):
+        with self.id_lock:
+            ident = self.msg_id
+            self.msg_id = (self.msg_id + 1) & 0xFF
+            if self.msg_id == 0:
+                self.msg_id = 1
+        return ident
+
+    def send(
+        self,
+        label,
+        dest,
+        payload,
+        on_done=None,
+        reliable=None,
+        members=None,
+        priority=PRIORITY_NORMAL,
+        targets=(),
+        toggle=False,
+    ):
+        # Called from the UI thread; returns immediately with the packet id.
+        # on_done(result) is called back from poll_done() once the command is
+        # on air, or for reliable sends once it is ACKed or out of retries.
+        # members are (label, dest, payload, targets) for each node of a
+        # group command in payload; on_done is then called once per member
+        # node. targets name what the command moves (say "front" for open /
+        # close); toggle marks commands that flip them instead.
+        if reliable is None:
+            reliable = self.ack_retries > 0 and (dest != RH_BROADCAST_ADDRESS or bool(members))
+
+        ident = self.next_id()
+        queued_at = time.monotonic()
+        if members:
+            members = tuple(
+                TxCommand(
+                    member_label, member_dest, member_payload, ident, on_done, queued_at, reliable, 1, None, priority, tuple(member_targets)
+                )
+                for member_label, member_dest, member_payload, member_targets in members
+            )
+            targets = tuple(targets) or tuple(t for member in members for t in member.targets)
+        self.tx_queue.put(
+            TxCommand(label, dest, payload, ident, on_done, queued_at, reliable, 1, members or None, priority, tuple(targets), toggle)
+        )
+        return ident
+
+    def poll_done(self):
+        # Runs completion callbacks on the calling (UI) thread.
+        results = []
+        while True:
+            try:
+                result = self.tx_done.get_nowait()
+            except queue.Empty:
+                return results
+            if result.cmd.on_done is not None:
+                result.cmd.on_done(result)
+            results.append(result)
+
+    def stop(self, timeout=1.0):
+        self.stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.receiver.close()
+
+    def run(self):
+        while not self.stopping.is_set():
+            if self.airtime is not None:
+                self.airtime.expire(time.monotonic())
+            self.check_ack_timeouts()
+            self.transmit_pending()
+            timeout = self.rx_timeout()
+            if self.rx_drain:
+                self.drain_rx(timeout)
+            else:
+                self.receive_once(timeout)
+
+    def gap_for(self, dest):
+        return self.node_gaps.get(dest, self.node_gap)
+
+    def held_until(self, dest, cmds):
+        # A fresh command for an aggregating node waits out the window,
+        # unless a full frame is already queued.
+        head = cmds[0]
+        if dest not in self.aggregate_nodes or head.attempt > 1 or head.members or len(cmds) >= MULTI_COMMAND_MAX:
+            return 0.0
+        return head.queued_at + self.aggregate_window
+
+    def paced_until(self, cmds, now):
+        # Checked against the frame as it will go out, packed with the
+        # commands behind it when its node aggregates.
+        cmd = cmds[0]
+        if self.airtime is None or cmd.priority == PRIORITY_SAFETY or cmd.attempt > 1:
+            return 0.0
+        batch = self.batch_for(cmd, islice(cmds, 1, None))
+        length = len(cmd.payload) if len(batch) == 1 else PANEL_COMMAND_LEN * (len(batch) + 1)
+        return self.airtime.tx_free_at(length, now)
+
+    def waits_behind(self, cmd):
+        # True while an older command in another queue moves any of the
+        # same panels, e.g. a Front Close behind a queued Open All.
+        for dest, cmds in self.pending.items():
+            if dest != cmd.dest and any(c.queued_at < cmd.queued_at and overlaps(c, cmd) for c in cmds):
+                return True
+        return False
+
+    def ready_at(self, dest, cmds, now):
+        # When the head of a queue may go out, or None while only a packet
+        # or an ACK deadline can free it: one of its nodes is waiting for an
+        # ACK or group confirm, or it waits behind another queue. A group
+        # command needs all of its nodes free.
+        cmd = cmds[0]
+        nodes = [dest] + [member.dest for member in cmd.members or ()]
+        if any(node in self.awaiting or node in self.group_pending for node in nodes):
+            return None
+        if self.waits_behind(cmd):
+            return None
+        return max(
+            max(self.node_ready_at.get(node, 0.0) for node in nodes),
+            self.held_until(dest, cmds),
+            self.paced_until(cmds, now),
+        )
+
+    def next_ready(self, now):
+        # Most urgent, then oldest, queued command whose node is free, so nodes interleave
+        # while each node still sees its commands in order.
+        best = None
+        for dest, cmds in self.pending.items():
+            if not cmds:
+                continue
+            ready_at = self.ready_at(dest, cmds, now)
+            if ready_at is None:
+                continue
+            if ready_at > now:
+                if self.paced_until(cmds, now) > now:
+                    self.paced.add(cmds[0].ident)
+                continue
+            if best is None or (cmds[0].priority, cmds[0].queued_at) < (best.priority, best.queued_at):
+                best = cmds[0]
+        return best
+
+    def rx_timeout(self):
+        # Shorten the receive wait when a queued command or an ACK deadline
+        # comes up sooner than the normal poll interval. Blocked queues wake
+        # with the ACK deadline they wait on.
+        now = time.monotonic()
+        due = [deadline for cmd, sent_at, deadline in self.awaiting.values()]
+        for dest, cmds in self.pending.items():
+            ready_at = self.ready_at(dest, cmds, now) if cmds else None
+            if ready_at is not None:
+                due.append(max(ready_at, self.next_tx_at))
+        if not due:
+            return RX_POLL_SECONDS
+
+        return min(RX_POLL_SECONDS, max(0.0, min(due) - now))
+
+    def enqueue(self, cmd):
+        cmds = self.pending.setdefault(cmd.dest, deque())
+
+        # Only the latest intent per panel goes out. A new command drops the
+        # waiting ones whose panels it all sets again, in every queue, so
+        # Close All also replaces a queued Front Open or Rear Top Open. A
+        # second press of a queued toggle cancels both. Retries are already
+        # on air and stay.
+        if cmd.targets and cmd.toggle:
+            last = max(
+                (c for queued in self.pending.values() for c in queued if c.attempt == 1 and overlaps(c, cmd)),
+                key=lambda c: c.queued_at,
+                default=None,
+            )
+            if last is not None and last.toggle and last.targets == cmd.targets:
+                self.remove_queued(last)
+                self.tx_coalesced += 2
+                return
+        elif cmd.targets:
+            for queued in self.pending.values():
+                for c in [c for c in queued if c.attempt == 1 and c.targets and set(c.targets) <= set(cmd.targets)]:
+                    self.remove_queued(c)
+                    self.tx_coalesced += 1
+
+        # Ahead of queued commands that are less urgent, unless they move
+        # the same panels; behind the rest.
+        at = len(cmds)
+        while at > 0:
+            prev = cmds[at - 1]
+            if prev.attempt > 1 or prev.priority <= cmd.priority or overlaps(prev, cmd):
+                break
+            at -= 1
+        cmds.insert(at, cmd)
+
+        if len(cmds) > TX_QUEUE_LIMIT:
+            worst = max(c.priority for c in cmds if c.attempt == 1)
+            victim = next(c for c in cmds if c.attempt == 1 and c.priority == worst)
+            self.remove_queued(victim)
+            self.tx_dropped += 1
+            print(f"TX queue for node {cmd.dest} full, dropped {victim.label}")
+            for member in victim.members or (victim,):
+                self.tx_done.put(TxResult(member, False, None, None, time.monotonic()))
+            self.notify()
+
+    def remove_queued(self, cmd):
+        self.pending[cmd.dest].remove(cmd)
+        self.paced.discard(cmd.ident)
+
+    def transmit_pending(self):
+        while True:
+            try:
+                cmd = self.tx_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.enqueue(cmd)
+
+        self.tx_depth = sum(len(cmds) for cmds in self.pending.values())
+        self.tx_peak_depth = max(self.tx_peak_depth, self.tx_depth)
+
+        now = time.monotonic()
+        if now < self.next_tx_at:
+            return
+
+        cmd = self.next_ready(now)
+        if cmd is None:
+            return
+
+        if self.csma is not None:
+            quiet_for = None if self.last_heard_at is None else now - self.last_heard_at
+            delay = self.csma.check(self.rfm69.rssi, self.csma_tries, quiet_for)
+            if delay:
+                self.csma_tries += 1
+                self.next_tx_at = now + delay
+                return
+            self.csma_tries = 0
+
+        self.pending[cmd.dest].popleft()
+        if cmd.dest in self.aggregate_nodes:
+            cmd = self.aggregate(cmd)
+        if cmd.ident in self.paced:
+            self.paced.discard(cmd.ident)
+            self.tx_paced += 1
+        ok = self.transmit(cmd)
+
+        sent_at = time.monotonic()
+        self.next_tx_at = sent_at + self.tx_gap
+        self.node_ready_at[cmd.dest] = sent_at + self.gap_for(cmd.dest)
+        if cmd.members:
+            for member in cmd.members:
+                self.node_ready_at[member.dest] = sent_at + self.gap_for(member.dest)
+
+        outcome = self.outcome_for(cmd.dest)
+        outcome["sent"] += 1
+        if cmd.attempt > 1:
+            outcome["retries"] += 1
+
+        if cmd.dest == RH_BROADCAST_ADDRESS and cmd.members and cmd.reliable:
+            self.group_pending = {member.dest for member in cmd.members}
+            if ok:
+                self.awaiting[cmd.dest] = (cmd, sent_at, sent_at + GROUP_REPLY_WINDOW_SECONDS + self.ack_timeout)
+            else:
+                self.group_fallback(cmd, sent_at)
+        elif cmd.reliable and ok:
+            # Stop-and-wait per node, like RHReliableDatagram::sendtoWait().
+            # Each retry waits longer, with jitter so nodes do not line up.
+            wait = self.ack_timeout * (2 ** (cmd.attempt - 1)) + random.uniform(0, self.ack_timeout)
+            self.awaiting[cmd.dest] = (cmd, sent_at, sent_at + wait)
+        else:
+            self.finish(cmd, ok, sent_at, False if cmd.reliable else None)
+
+    def transmit(self, cmd):
+        if self.trace:
+            print(f"TX {cmd.label} -> node {cmd.dest}: {cmd.payload.hex(' ')}")
+
+        if self.power is not None:
+            self.set_tx_power(self.power.power_for(cmd.dest, cmd.attempt))
+
+        flags = RH_FLAGS_RETRY if cmd.attempt > 1 else 0
+        ok = self.rfm69.send(
+            cmd.payload,
+            destination=cmd.dest,
+            node=self.node,
+            identifier=cmd.ident,
+            flags=flags,
+            keep_listening=True,
+        )
+        if self.airtime is not None:
+            self.airtime.charge(len(cmd.payload), time.monotonic())
+        if self.event_log is not None:
+            self.event_log.log(EVENT_TX, cmd.dest, cmd.ident, flags, 0, cmd.payload)
+        return ok
+
+    def batch_for(self, cmd, following):
+        # cmd plus the plain commands right behind it that aggregate() packs
+        # into the same multi-command frame. Retries and group commands go
+        # as they are.
+        if cmd.dest not in self.aggregate_nodes or cmd.attempt > 1 or cmd.members or len(cmd.payload) != PANEL_COMMAND_LEN:
+            return [cmd]
+
+        batch = [cmd]
+        for nxt in following:
+            if len(batch) == MULTI_COMMAND_MAX:
+                break
+            if nxt.attempt > 1 or nxt.members or len(nxt.payload) != PANEL_COMMAND_LEN or nxt.reliable != cmd.reliable:
+                break
+            batch.append(nxt)
+        return batch
+
+    def aggregate(self, cmd):
+        # Packs the plain commands queued behind cmd for the same node into
+        # one multi-command frame.
+        cmds = self.pending[cmd.dest]
+        batch = self.batch_for(cmd, cmds)
+        if len(batch) == 1:
+            return cmd
+
+        for n in range(len(batch) - 1):
+            cmds.popleft()
+        return cmd._replace(
+            label=" + ".join(c.label for c in batch),
+            payload=multi_command([c.payload for c in batch]),
+            members=tuple(c._replace(ident=cmd.ident) for c in batch),
+        )
+
+    def set_tx_power(self, dbm):
+        if dbm != self.tx_power:
+            self.rfm69.tx_power = dbm
+            self.tx_power = dbm
+
+    def outcome_for(self, dest):
+        if dest not in self.outcomes:
+            self.outcomes[dest] = {"sent": 0, "acked": 0, "failed": 0, "retries": 0}
+        return self.outcomes[dest]
+
+    def finish(self, cmd, ok, sent_at, acked=None):
+        if self.link is not None and acked is not None:
+            self.link.record_tx(cmd.dest, cmd.attempt, acked)
+        if self.power is not None:
+            # Every packet from a Feather comes in at the same 14 dBm, so the
+            # recent average RSSI says how much margin the node has.
+            rssi = self.link.summary(cmd.dest).rssi_avg if self.link is not None else None
+            self.power.on_result(cmd.dest, cmd.attempt, acked, rssi)
+        if acked is True:
+            self.outcome_for(cmd.dest)["acked"] += 1
+        elif acked is False:
+            self.outcome_for(cmd.dest)["failed"] += 1
+            print(f"TX {cmd.label} -> node {cmd.dest}: no ACK after {cmd.attempt} attempts")
+            if self.event_log is not None:
+                self.event_log.log(EVENT_TX_NOACK, cmd.dest, cmd.ident, 0, 0, cmd.payload)
+
+        done_at = time.monotonic()
+        for member in cmd.members or (cmd,):
+            self.tx_done.put(TxResult(member, ok and acked is not False, sent_at, acked, done_at))
+        self.notify()
+
+    def notify(self):
+        if self.on_event is not None:
+            self.on_event()
+
+    def check_ack_timeouts(self):
+        now = time.monotonic()
+        for dest, (cmd, sent_at, deadline) in list(self.awaiting.items()):
+            if now < deadline:
+                continue
+
+            del self.awaiting[dest]
+            if dest == RH_BROADCAST_ADDRESS:
+                self.group_fallback(cmd, now)
+                continue
+
+            self.ack_timeouts += 1
+            if cmd.attempt <= self.ack_retries:
+                # Same id with the retry flag, so the Feather can drop the
+                # duplicate and just re-ACK it.
+                self.pending.setdefault(dest, deque()).appendleft(cmd._replace(attempt=cmd.attempt + 1))
+                self.node_ready_at[dest] = now
+            else:
+                self.finish(cmd, False, sent_at, False)
+
+    def group_fallback(self, cmd, now):
+        # Nodes that did not confirm get the plain unicast command with a
+        # new id, through the normal ACK and retry path. That also covers
+        # Feathers still running firmware without group commands.
+        for member in cmd.members:
+            if member.dest not in self.group_pending:
+                continue
+            print(f"TX {cmd.label}: no group confirm from node {member.dest}, sending {member.label}")
+            self.pending.setdefault(member.dest, deque()).appendleft(member._replace(ident=self.next_id()))
+            self.node_ready_at[member.dest] = now
+        self.group_pending = set()
+
+    def group_confirmed(self, sender, ident):
+        waiting = self.awaiting.get(RH_BROADCAST_ADDRESS)
+        if waiting is None or waiting[0].ident != ident or sender not in self.group_pending:
+            return
+        cmd, sent_at, deadline = waiting
+        self.group_pending.discard(sender)
+        for member in cmd.members:
+            if member.dest == sender:
+                self.finish(member, True, sent_at, True)
+        if not self.group_pending:
+            del self.awaiting[RH_BROADCAST_ADDRESS]
+
+    def send_ack(self, dest, ident):
+        if self.power is not None:
+            self.set_tx_power(self.power.power_for(dest))
+        self.rfm69.send(
+            RH_ACK_PAYLOAD,
+            destination=dest,
+            node=self.node,
+            identifier=ident,
+            flags=RH_FLAGS_ACK,
+            keep_listening=True,
+        )
+        if self.airtime is not None:
+            self.airtime.charge(len(RH_ACK_PAYLOAD), time.monotonic())
+        if self.event_log is not None:
+            self.event_log.log(EVENT_TX, dest, ident, RH_FLAGS_ACK, 0, RH_ACK_PAYLOAD)
+
+    def is_duplicate(self, sender, ident, now):
+        # (from, id) pairs seen inside the dedup window. Entries are kept in
+        # arrival order, so expired ones are always at the front.
+        while self.seen:
+            key, seen_at = next(iter(self.seen.items()))
+            if now - seen_at < self.dedup_window:
+                break
+            self.seen.popitem(last=False)
+
+        key = (sender, ident)
+        duplicate = key in self.seen
+        self.seen.pop(key, None)
+        self.seen[key] = now
+        return duplicate
+
+    def handle_reliable(self, dest, sender, ident, flags, now):
+        # Returns True when the packet was link-level traffic that the UI
+        # should not see: an ACK for us, or a retry we already handled.
+        if flags & RH_FLAGS_ACK:
+            waiting = self.awaiting.get(sender)
+            if waiting is not None and waiting[0].ident == ident and sender != RH_BROADCAST_ADDRESS:
+                del self.awaiting[sender]
+                self.finish(waiting[0], True, waiting[1], True)
+            else:
+                self.group_confirmed(sender, ident)
+            return True
+
+        if dest != self.node:
+            return False
+
+        self.send_ack(sender, ident)
+        if self.is_duplicate(sender, ident, now):
+            if self.trace:
+                print(f"RX duplicate from {sender} id={ident}, re-ACKed")
+            if self.event_log is not None:
+                self.event_log.log(EVENT_RX_DUP, sender, ident)
+            return True
+        return False
+
+    def receive_once(self, timeout=RX_POLL_SECONDS):
+        # Returns None when nothing arrived, otherwise True if the packet
+        # was queued without pushing an older one out.
+        pkt = self.receiver.receive(timeout)
+        if pkt is None:
+            return None
+
+        self.rx_handled += 1
+        frame = decode_frame(pkt)
+        if frame is None:
+            return True
+
+        # The driver hands over a fresh bytearray per packet, so the body
+        # can stay a view into it all the way to the UI.
+        dest, sender, ident, flags, body = frame
+        now = time.monotonic()
+        # last_rssi is latched while the packet is in the FIFO; the live
+        # register reads the noise floor by now. The driver gives half dB
+        # steps as a float; whole dB is plenty for the log, the link stats
+        # and the UI.
+        rssi = round(self.rfm69.last_rssi)
+        self.last_heard_at = now
+
+        if self.trace:
+            print("RX " + format_frame(dest, sender, ident, flags, body, rssi))
+        if self.event_log is not None:
+            self.event_log.log(EVENT_RX, sender, ident, flags, rssi, body)
+        if self.link is not None:
+            self.link.record_rx(sender, ident, flags, rssi, now)
+        if self.airtime is not None:
+            self.airtime.charge(len(body), now, sender)
+
+        if self.handle_reliable(dest, sender, ident, flags, now):
+            return True
+
+        return self.queue_rx(RxPacket(dest, sender, ident, flags, body, rssi, now))
+
+    def queue_rx(self, packet):
+        # When the UI falls behind, the oldest packet is dropped so the
+        # newest status always gets through.
+        dropped = False
+        while True:
+            try:
+                self.rx_queue.put_nowait(packet)
+                break
+            except queue.Full:
+                try:
+                    old = self.rx_queue.get_nowait()
+                    dropped = True
+                except queue.Empty:
+                    continue
+                if self.event_log is not None:
+                    self.event_log.log(EVENT_RX_DROP, old.sender, old.ident, old.flags, old.rssi, old.body)
+
+        if dropped:
+            self.rx_dropped += 1
+        self.notify()
+        return not dropped
+
+    def drain_rx(self, timeout=RX_POLL_SECONDS):
+        # Wait up to one poll interval for the first packet, then keep
+        # pulling whatever is already waiting until the budget runs out.
+        handled = 0
+        dropped = 0
+        deadline = None
+
+        while True:
+            queued = self.receive_once(timeout)
+            if queued is None:
+                break
+
+            handled += 1
+            if not queued:
+                dropped += 1
+
+            if deadline is None:
+                deadline = time.monotonic() + self.rx_budget
+            elif time.monotonic() >= deadline:
+                break
+            timeout = 0
+
+        self.last_drain = (handled, dropped)
+        if self.trace and (handled > 1 or dropped):
+            print(f"RX drain: {handled} handled, {dropped} dropped")
+        return handled, dropped
@@ -2,6 +2,9 @@
 
 import os
 import time
+import queue
+import functools
+import threading
 import subprocess
 
 import board
@@ -11,54 +14,103 @@ import adafruit_rfm69
 import adafruit_ssd1306
 
 from digitalio import DigitalInOut
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
+
+from r2n2_commands import (
+    BODY_NODE,
+    COMMANDS,
+    GROUP_SEQUENCES,
+    NODE_NAMES,
+    PI_NODE,
+    PRIORITY_NORMAL,
+    SEQUENCES,
+    SOUND_COMMANDS,
+    STATUS_TEXT,
+    STEALTH_COMMANDS,
+    ACTION_STATUS_UPDATE,
+    apply_command_state,
+    sound_label,
+)
+from r2n2_airtime import AirtimeBudget
+from r2n2_codec import decode_panel_command
+from r2n2_csma import CarrierSense
+from r2n2_eventlog import open_event_log
+from r2n2_latency import LATENCY_STAGES, LatencyTracker
+from r2n2_link import LINK_WINDOW, LinkTracker
+from r2n2_oled import OledWriter
+from r2n2_power import TxPowerController
+from r2n2_radio import TX_QUEUE_LIMIT, RadioWorker, make_receiver
 
 
 RADIO_FREQ_MHZ = 915.0
 TX_POWER = 14
-
-PI_NODE = 99
-BODY_NODE = 10
-FRONT_NODE = 20
-REAR_NODE = 30
-DOME_NODE = 40
-
-ACTION_SERVO_GROUP_MOVE = 2
-ACTION_DOME_ALL_OPEN = 5
-ACTION_DOME_ALL_CLOSE = 6
-ACTION_DOME_WAVE = 7
-ACTION_FRONT_ARM_FLAIL = 8
-ACTION_FRONT_CHARGE_TOGGLE = 9
-ACTION_FRONT_DATA_TOGGLE = 10
-ACTION_REAR_TOP_TOGGLE = 11
-ACTION_REAR_TOP_OPEN = 12
-ACTION_REAR_TOP_CLOSE = 13
-ACTION_STATUS_UPDATE = 0x40
-ACTION_STEALTH_SOUND = 0x30
-
-GROUP_ALL_SERVOS = 255
-SERVO_POS_OPEN = 1
-SERVO_POS_CLOSED = 2
-
-SOUND_BANKS = {
-    1: "General",
-    2: "Chatty",
-    3: "Sad",
-    4: "Burp",
-    5: "Whistle",
-    6: "Scream",
-    7: "Warning",
-    8: "Short",
-    9: "Leia",
-    10: "Imperial",
-    11: "Star Wars",
-    12: "Dance",
-    13: "Cantina",
-}
+# "adaptive" steps each node's TX power between TX_POWER_MIN and TX_POWER_MAX
+# from its ACKs and RSSI, starting at TX_POWER; "fixed" always uses TX_POWER.
+# TX_POWER_OVERRIDES pins single nodes in either mode, e.g. {40: 20} for the Dome.
+TX_POWER_MODE = "adaptive"
+TX_POWER_MIN = 2
+TX_POWER_MAX = 20
+TX_POWER_OVERRIDES = {}
 
 FPS = 30
+# With ADAPTIVE_FRAMES the loop sleeps in pygame.event.wait() and wakes at
+# once on input, radio traffic or command results. After IDLE_AFTER_SECONDS
+# without any of those it only wakes at IDLE_FPS.
+ADAPTIVE_FRAMES = True
+IDLE_FPS = 2
+IDLE_AFTER_SECONDS = 5
+# "dirty" repaints only the regions whose inputs changed, "full" redraws
+# the whole screen every frame.
+RENDER_MODE = "dirty"
+TEXT_CACHE_SIZE = 256
 STARTUP_DELAY_SECONDS = 2
 COMMAND_DELAY_SECONDS = 0.15
+TX_GAP_SECONDS = 0.02
+ACK_RETRIES = 3
+# "broadcast" sends Open All / Close All as one group command that every
+# panel confirms, falling back to unicast for any that do not; "unicast"
+# sends one command per node.
+GROUP_COMMAND_MODE = "broadcast"
+# Commands queued for one of these nodes within AGGREGATE_WINDOW_SECONDS
+# (or while it is still busy with the last one) go out together in one
+# multi-command frame. Only list a node once its Feather runs firmware with
+# ACTION_MULTI_COMMAND: older firmware ACKs the frame and then ignores it, so
+# the commands would show as delivered while nothing moves. For example
+# (BODY_NODE, FRONT_NODE, REAR_NODE, DOME_NODE) once all four are reflashed.
+AGGREGATE_NODES = ()
+AGGREGATE_WINDOW_SECONDS = 0.01
+# Channel time the Pi's own packets may use per AIRTIME_WINDOW_SECONDS
+# before sounds and other ordinary commands are paced; closes always go.
+# None turns pacing off, the Status page still shows the channel load.
+AIRTIME_BUDGET = 0.25
+AIRTIME_WINDOW_SECONDS = 1.0
+# Listen before talk: back off while the RSSI says someone else is on air.
+# CSMA_THRESHOLD_DBM None calibrates the threshold from the noise floor at
+# start-up; a number pins it.
+CARRIER_SENSE = False
+CSMA_THRESHOLD_DBM = None
+
+# "dio0" waits on the RFM69 PayloadReady interrupt line, "poll" reads the
+# radio over SPI. dio0 falls back to poll if gpiod is not available.
+RX_BACKEND = "dio0"
+DIO0_GPIO_CHIP = "/dev/gpiochip0"
+DIO0_GPIO_LINE = 22
+
+# Every radio packet is recorded in a binary ring file instead of printed;
+# read it back with `python3 r2n2_eventlog.py r2n2_events.bin`. None turns
+# the log off, RADIO_TRACE brings back the printed TX/RX lines.
+EVENT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "r2n2_events.bin")
+RADIO_TRACE = False
+
+# "monitor" follows `nmcli monitor` and only queries WiFi state when
+# NetworkManager reports a change, "poll" queries every WIFI_POLL_SECONDS.
+WIFI_STATUS_MODE = "monitor"
+WIFI_POLL_SECONDS = 5
+WIFI_MONITOR_POLL_SECONDS = 60
+RX_DRAIN_BUDGET_SECONDS = 0.005
+# Without ACKs, the first packet back from a node this soon after a command
+# counts as its reply on the Status page.
+LATENCY_REPLY_WINDOW_SECONDS = 1.0
 
 BG = (8, 10, 14)
 PANEL = (28, 32, 42)
@@ -83,25 +135,16 @@ TEXT_DIM = (170, 178, 190)
 STATUS_OK = (55, 150, 80)
 
 
-def sound_label(bank):
-    return SOUND_BANKS.get(bank, f"Custom {bank}")
-
-
 # OLED
 i2c = busio.I2C(board.SCL, board.SDA)
 oled_reset = DigitalInOut(board.D4)
 display = adafruit_ssd1306.SSD1306_I2C(128, 32, i2c, reset=oled_reset)
 oled_font = ImageFont.load_default()
+oled_writer = OledWriter(display, oled_font)
 
 
 def oled(line1="", line2="", line3=""):
-    image = Image.new("1", (128, 32))
-    draw = ImageDraw.Draw(image)
-    draw.text((0, 0), line1[:21], font=oled_font, fill=255)
-    draw.text((0, 10), line2[:21], font=oled_font, fill=255)
-    draw.text((0, 20), line3[:21], font=oled_font, fill=255)
-    display.image(image)
-    display.show()
+    oled_writer.write(line1, line2, line3)
 
 
 # Radio
@@ -115,7 +158,50 @@ rfm69.node = PI_NODE
 rfm69.destination = BODY_NODE
 rfm69.encryption_key = None
 
-msg_id = 1
+event_log = open_event_log(EVENT_LOG_PATH) if EVENT_LOG_PATH else None
+link = LinkTracker(NODE_NAMES)
+
+if TX_POWER_MODE == "adaptive":
+    power = TxPowerController(TX_POWER, TX_POWER_MIN, TX_POWER_MAX, overrides=TX_POWER_OVERRIDES)
+elif TX_POWER_OVERRIDES:
+    power = TxPowerController(TX_POWER, TX_POWER, TX_POWER, overrides=TX_POWER_OVERRIDES)
+else:
+    power = None
+
+# Time on air follows the modem settings the radio is actually using.
+airtime = AirtimeBudget(
+    AIRTIME_WINDOW_SECONDS,
+    AIRTIME_BUDGET,
+    rfm69.bitrate,
+    rfm69.preamble_length,
+    len(rfm69.sync_word),
+)
+
+csma = None
+if CARRIER_SENSE:
+    csma = CarrierSense(CSMA_THRESHOLD_DBM)
+    rfm69.listen()
+    csma.calibrate(lambda: rfm69.rssi)
+    print(f"Carrier sense: noise floor {csma.noise_floor:.0f} dBm, threshold {csma.threshold:.0f} dBm")
+
+radio = RadioWorker(
+    rfm69,
+    PI_NODE,
+    node_gap=COMMAND_DELAY_SECONDS,
+    tx_gap=TX_GAP_SECONDS,
+    rx_drain=True,
+    rx_budget=RX_DRAIN_BUDGET_SECONDS,
+    ack_retries=ACK_RETRIES,
+    receiver=make_receiver(rfm69, RX_BACKEND, DIO0_GPIO_CHIP, DIO0_GPIO_LINE),
+    trace=RADIO_TRACE,
+    event_log=event_log,
+    link=link,
+    power=power,
+    aggregate_nodes=AGGREGATE_NODES,
+    aggregate_window=AGGREGATE_WINDOW_SECONDS,
+    airtime=airtime,
+    csma=csma,
+)
 
 
 state = {
@@ -134,8 +220,16 @@ state = {
     "confirm_shutdown": False,
     "confirm_exit": False,
     "confirm_wifi_off": False,
+    "diagnostics": False,
 }
 
+# Command timings for the Status page. input_at is when the main loop
+# picked up the keypress or tap being handled, reply_wait holds the last
+# unACKed command per node until that node answers.
+latency = LatencyTracker()
+input_at = None
+reply_wait = {}
+
 
 def run_cmd(cmd):
     try:
@@ -151,8 +245,88 @@ def run_cmd(cmd):
         return 1, "", str(exc)
 
 
-def get_wifi_status():
-    code, out, err = run_cmd(["nmcli", "radio", "wifi"])
+class CommandExecutor(threading.Thread):
+    # Runs system commands off the UI thread. Results come back through
+    # poll(), which calls each on_done(code, out, err) on the UI thread.
+    def __init__(self):
+        super().__init__(name="system", daemon=True)
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.pending_keys = set()
+        self.lock = threading.Lock()
+        self.on_result = None
+
+    def submit(self, cmd, on_done=None, key=None):
+        # Jobs with a key are coalesced: a second request while one is
+        # still queued or running is dropped.
+        if key is not None:
+            with self.lock:
+                if key in self.pending_keys:
+                    return False
+                self.pending_keys.add(key)
+        self.jobs.put((cmd, on_done, key))
+        return True
+
+    def run(self):
+        while True:
+            cmd, on_done, key = self.jobs.get()
+            if cmd is None:
+                return
+
+            result = run_cmd(cmd)
+            if key is not None:
+                with self.lock:
+                    self.pending_keys.discard(key)
+            self.results.put((on_done, result))
+            if self.on_result is not None:
+                self.on_result()
+
+    def poll(self):
+        while True:
+            try:
+                on_done, result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if on_done is not None:
+                on_done(*result)
+
+    def stop(self):
+        self.jobs.put((None, None, None))
+
+
+class NetworkMonitor(threading.Thread):
+    # `nmcli monitor` prints a line for every NetworkManager state change,
+    # including the WiFi radio being switched on or off.
+    def __init__(self, on_change):
+        super().__init__(name="nmcli-monitor", daemon=True)
+        self.on_change = on_change
+        self.proc = None
+
+    def run(self):
+        try:
+            self.proc = subprocess.Popen(
+                ["nmcli", "monitor"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+        except Exception as exc:
+            print(f"nmcli monitor unavailable: {exc}")
+            return
+
+        for line in self.proc.stdout:
+            self.on_change(line.strip())
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+
+executor = CommandExecutor()
+network_monitor = NetworkMonitor(lambda line: update_wifi_status())
+
+
+def parse_wifi_status(code, out):
     if code == 0:
         value = out.strip().lower()
         if value in ("enabled", "disabled"):
@@ -160,12 +334,16 @@ def get_wifi_status():
     return "unknown"
 
 
+def wifi_status_done(code, out, err):
+    state["wifi_status"] = parse_wifi_status(code, out)
+
+
 def update_wifi_status():
-    state["wifi_status"] = get_wifi_status()
+    # Safe to call from any thread; the result lands in state on the UI thread.
+    executor.submit(["nmcli", "radio", "wifi"], wifi_status_done, key="wifi_status")
 
 
-def wifi_off():
-    code, out, err = run_cmd(["sudo", "nmcli", "radio", "wifi", "off"])
+def wifi_off_done(code, out, err):
     update_wifi_status()
     if code == 0:
         state["status_message"] = "WiFi turned off"
@@ -175,8 +353,7 @@ def wifi_off():
         oled("WiFi OFF failed", err[:21], "")
 
 
-def wifi_on():
-    code, out, err = run_cmd(["sudo", "nmcli", "radio", "wifi", "on"])
+def wifi_on_done(code, out, err):
     update_wifi_status()
     if code == 0:
         state["status_message"] = "WiFi turned on"
@@ -186,7 +363,18 @@ def wifi_on():
         oled("WiFi ON failed", err[:21], "")
 
 
+def wifi_off():
+    if executor.submit(["sudo", "nmcli", "radio", "wifi", "off"], wifi_off_done, key="wifi_toggle"):
+        state["status_message"] = "Turning WiFi off..."
+
+
+def wifi_on():
+    if executor.submit(["sudo", "nmcli", "radio", "wifi", "on"], wifi_on_done, key="wifi_toggle"):
+        state["status_message"] = "Turning WiFi on..."
+
+
 def action_wifi_toggle():
+    # Decide from the cached status; the monitor or poller keeps it fresh.
     update_wifi_status()
     if state["wifi_status"] == "enabled":
         state["confirm_wifi_off"] = True
@@ -197,239 +385,110 @@ def action_wifi_toggle():
         wifi_on()
 
 
-def payload_group_open():
-    return bytes([ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0])
-
-
-def payload_group_close():
-    return bytes([ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0])
-
-
-def payload_dome_open():
-    return bytes([ACTION_DOME_ALL_OPEN, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0])
-
-
-def payload_dome_close():
-    return bytes([ACTION_DOME_ALL_CLOSE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0])
-
-
-def payload_dome_wave():
-    return bytes([ACTION_DOME_WAVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0])
-
-
-def payload_front_arm_flail():
-    return bytes([ACTION_FRONT_ARM_FLAIL, 0x00, 0x00, 0x00])
-
-
-def payload_front_charge_toggle():
-    return bytes([ACTION_FRONT_CHARGE_TOGGLE, 2, 0x00, 0x00])
-
-
-def payload_front_data_toggle():
-    return bytes([ACTION_FRONT_DATA_TOGGLE, 6, 0x00, 0x00])
-
-
-def payload_rear_top_toggle():
-    return bytes([ACTION_REAR_TOP_TOGGLE, 2, 0x00, 0x00])
-
-
-def payload_rear_top_open():
-    return bytes([ACTION_REAR_TOP_OPEN, 2, SERVO_POS_OPEN, 0x00])
-
-
-def payload_rear_top_close():
-    return bytes([ACTION_REAR_TOP_CLOSE, 2, SERVO_POS_CLOSED, 0x00])
-
-
-def payload_sound_bank(bank):
-    return bytes([ACTION_STEALTH_SOUND, bank, 0x00, 0x00])
-
-
-def send_radio_command(label, dest, payload):
-    global msg_id
+def command_sent(result):
+    cmd = result.cmd
+    if result.ok:
+        latency.add(cmd.dest, cmd.label, "queue", result.sent_at - cmd.queued_at)
+    if result.acked:
+        latency.add(cmd.dest, cmd.label, "reply", result.done_at - result.sent_at)
+    elif result.acked is None and result.ok:
+        reply_wait[cmd.dest] = (cmd.label, result.sent_at)
+
+    if result.acked is False:
+        state["status_message"] = f"No ACK from node {cmd.dest}: {cmd.label}"
+        oled("TX no ACK", cmd.label, f"to {cmd.dest} id {cmd.ident}")
+    elif not result.ok:
+        state["status_message"] = f"TX failed: {cmd.label}"
+        oled("TX failed", cmd.label, f"to {cmd.dest} id {cmd.ident}")
+    else:
+        oled("TX", cmd.label, f"to {cmd.dest} id {cmd.ident}")
 
-    print(f"TX {label} -> node {dest}: {payload.hex(' ')}")
-    oled("TX", label, f"to {dest} id {msg_id}")
 
-    rfm69.send(
+def send_radio_command(label, dest, payload, members=None, priority=PRIORITY_NORMAL, targets=(), toggle=False):
+    if input_at is not None:
+        latency.add(dest, label, "input", time.monotonic() - input_at)
+    radio.send(
+        label,
+        dest,
         payload,
-        destination=dest,
-        node=PI_NODE,
-        identifier=msg_id,
-        flags=0,
-        keep_listening=True,
+        on_done=command_sent,
+        members=members,
+        priority=priority,
+        targets=targets,
+        toggle=toggle,
     )
 
     state["last_command"] = label
     state["status_message"] = f"Sent: {label}"
 
-    msg_id = (msg_id + 1) & 0xFF
-    if msg_id == 0:
-        msg_id = 1
-
-    time.sleep(COMMAND_DELAY_SECONDS)
-
 
 def apply_body_status_update(body):
-    if len(body) < 4 or body[0] != ACTION_STATUS_UPDATE:
+    command = decode_panel_command(body)
+    if command is None or command.action != ACTION_STATUS_UPDATE:
         return False
 
-    stealth_cmd = body[1]
-    status_value = body[2]
-    status_text = {0: "triggered", SERVO_POS_OPEN: "open", SERVO_POS_CLOSED: "closed"}.get(status_value, str(status_value))
-
-    command_labels = {
-        0x10: "Front Open",
-        0x11: "Front Close",
-        0x12: "Rear Open",
-        0x13: "Rear Close",
-        0x14: "Dome Open",
-        0x15: "Dome Close",
-        0x16: "Dome Wave",
-        0x17: "Arm Flail",
-        0x18: "Charge Bay Toggle",
-        0x19: "Data Panel Toggle",
-        0x26: "Rear Top Toggle",
-        0x1B: "Rear Top Open",
-        0x1C: "Rear Top Close",
-    }
-
-    if stealth_cmd == 0x10:
-        state["front"] = "open"
-        state["charge_bay"] = "open"
-        state["data_panel"] = "open"
-    elif stealth_cmd == 0x11:
-        state["front"] = "closed"
-        state["charge_bay"] = "closed"
-        state["data_panel"] = "closed"
-    elif stealth_cmd == 0x12:
-        state["rear"] = "open"
-        state["rear_top"] = "open"
-    elif stealth_cmd == 0x13:
-        state["rear"] = "closed"
-        state["rear_top"] = "closed"
-    elif stealth_cmd == 0x14:
-        state["dome"] = "open"
-    elif stealth_cmd == 0x15:
-        state["dome"] = "closed"
-    elif stealth_cmd == 0x16:
-        state["dome"] = "wave"
-    elif stealth_cmd == 0x18:
-        state["charge_bay"] = "open" if state["charge_bay"] != "open" else "closed"
-    elif stealth_cmd == 0x19:
-        state["data_panel"] = "open" if state["data_panel"] != "open" else "closed"
-    elif stealth_cmd == 0x26:
-        state["rear_top"] = "open" if state["rear_top"] != "open" else "closed"
-    elif stealth_cmd == 0x1B:
-        state["rear_top"] = "open"
-    elif stealth_cmd == 0x1C:
-        state["rear_top"] = "closed"
-
-    label = command_labels.get(stealth_cmd, f"STEALTH 0x{stealth_cmd:02X}")
+    # Status reports reuse the PanelCommand layout:
+    # [ACTION_STATUS_UPDATE, STEALTH code, status, relayed-to node]
+    _, stealth_cmd, status_value, _ = command
+    status_text = STATUS_TEXT.get(status_value) or str(status_value)
+
+    cmd = STEALTH_COMMANDS.get(stealth_cmd)
+    if cmd is not None:
+        apply_command_state(state, cmd)
+        label = cmd.label
+    else:
+        label = f"STEALTH 0x{stealth_cmd:02X}"
+
     state["last_command"] = f"STEALTH: {label}"
     state["status_message"] = f"STEALTH relayed: {label} ({status_text})"
     oled("STEALTH RX", label[:21], status_text[:21])
     return True
 
 
-def receive_once():
-    pkt = rfm69.receive(timeout=0.01, with_header=True)
-    if pkt is None:
-        return
-
-    if len(pkt) >= 4:
-        header = pkt[:4]
-        body = pkt[4:]
+def handle_rx_packet(pkt):
+    state["last_rx"] = f"Node {pkt.sender}"
+    rssi_avg = link.summary(pkt.sender).rssi_avg
+    state["last_rssi"] = f"{pkt.rssi} (avg {rssi_avg:.0f})" if rssi_avg is not None else str(pkt.rssi)
 
-        state["last_rx"] = f"Node {header[1]}"
-        state["last_rssi"] = str(rfm69.rssi)
+    waiting = reply_wait.pop(pkt.sender, None)
+    if waiting is not None and pkt.stamp - waiting[1] < LATENCY_REPLY_WINDOW_SECONDS:
+        latency.add(pkt.sender, waiting[0], "reply", pkt.stamp - waiting[1])
 
-        print(
-            f"RX RSSI {rfm69.rssi} | "
-            f"to={header[0]} from={header[1]} id={header[2]} "
-            f"flags=0x{header[3]:02X} | body={body.hex(' ')}"
-        )
-
-        if header[1] == BODY_NODE and apply_body_status_update(body):
-            return
-
-        oled("RX", f"from {header[1]}", f"RSSI {rfm69.rssi}")
-
-
-def action_front_open():
-    send_radio_command("Front Open", FRONT_NODE, payload_group_open())
-    state["front"] = "open"
-    state["charge_bay"] = "open"
-    state["data_panel"] = "open"
-
-
-def action_front_close():
-    send_radio_command("Front Close", FRONT_NODE, payload_group_close())
-    state["front"] = "closed"
-    state["charge_bay"] = "closed"
-    state["data_panel"] = "closed"
-
-
-def action_front_arm_flail():
-    send_radio_command("Arm Flail", FRONT_NODE, payload_front_arm_flail())
-    state["status_message"] = "Sent: Arm Flail"
-
-
-def action_charge_bay_toggle():
-    send_radio_command("Charge Bay Toggle", FRONT_NODE, payload_front_charge_toggle())
-    state["charge_bay"] = "open" if state["charge_bay"] != "open" else "closed"
-
-
-def action_data_panel_toggle():
-    send_radio_command("Data Panel Toggle", FRONT_NODE, payload_front_data_toggle())
-    state["data_panel"] = "open" if state["data_panel"] != "open" else "closed"
-
-
-def action_rear_open():
-    send_radio_command("Rear Open", REAR_NODE, payload_group_open())
-    state["rear"] = "open"
-    state["rear_top"] = "open"
-
-
-def action_rear_close():
-    send_radio_command("Rear Close", REAR_NODE, payload_group_close())
-    state["rear"] = "closed"
-    state["rear_top"] = "closed"
-
-
-def action_rear_top_toggle():
-    send_radio_command("Rear Top Toggle", REAR_NODE, payload_rear_top_toggle())
-    state["rear_top"] = "open" if state["rear_top"] != "open" else "closed"
+    if pkt.sender == BODY_NODE and apply_body_status_update(pkt.body):
+        return
 
+    oled("RX", f"from {pkt.sender}", f"RSSI {pkt.rssi}")
 
-def action_rear_top_open():
-    send_radio_command("Rear Top Open", REAR_NODE, payload_rear_top_open())
-    state["rear_top"] = "open"
 
+def process_radio_events():
+    radio.poll_done()
 
-def action_rear_top_close():
-    send_radio_command("Rear Top Close", REAR_NODE, payload_rear_top_close())
-    state["rear_top"] = "closed"
+    while True:
+        try:
+            pkt = radio.rx_queue.get_nowait()
+        except queue.Empty:
+            return
+        handle_rx_packet(pkt)
 
 
-def action_dome_open():
-    send_radio_command("Dome Open", DOME_NODE, payload_dome_open())
-    state["dome"] = "open"
+def run_command(cmd):
+    send_radio_command(cmd.label, cmd.dest, cmd.payload, cmd.radio_members, cmd.priority, cmd.targets, cmd.toggle)
+    apply_command_state(state, cmd)
 
 
-def action_dome_close():
-    send_radio_command("Dome Close", DOME_NODE, payload_dome_close())
-    state["dome"] = "closed"
+def run_sequence(name, message):
+    sequences = GROUP_SEQUENCES if GROUP_COMMAND_MODE == "broadcast" else SEQUENCES
+    for cmd in sequences[name]:
+        run_command(cmd)
+    state["status_message"] = message
 
 
-def action_dome_wave():
-    send_radio_command("Dome Wave", DOME_NODE, payload_dome_wave())
-    state["dome"] = "wave"
+def command_action(name):
+    return functools.partial(run_command, COMMANDS[name])
 
 
-def action_sound(bank):
-    state["selected_sound"] = bank
-    send_radio_command(f"Sound {bank}: {sound_label(bank)}", BODY_NODE, payload_sound_bank(bank))
+def sequence_action(name, message):
+    return functools.partial(run_sequence, name, message)
 
 
 def action_sound_minus():
@@ -451,34 +510,7 @@ def action_sound_plus():
 
 
 def action_play_selected_sound():
-    bank = state["selected_sound"]
-    send_radio_command(f"Sound {bank}: {sound_label(bank)}", BODY_NODE, payload_sound_bank(bank))
-
-
-def action_open_all():
-    action_front_open()
-    action_rear_open()
-    action_dome_open()
-    state["status_message"] = "Sent: Open All"
-
-
-def action_close_all():
-    action_dome_close()
-    action_rear_close()
-    action_front_close()
-    state["status_message"] = "Sent: Close All"
-
-
-def action_wake_up():
-    action_sound(1)
-    action_dome_open()
-    state["status_message"] = "Preset: Wake Up"
-
-
-def action_warning_all_open():
-    action_sound(7)
-    action_open_all()
-    state["status_message"] = "Preset: Warning + Open All"
+    run_command(SOUND_COMMANDS[state["selected_sound"]])
 
 
 def action_shutdown():
@@ -488,6 +520,16 @@ def action_shutdown():
     state["status_message"] = "Confirm shutdown"
 
 
+def action_status():
+    state["diagnostics"] = True
+    state["status_message"] = "Diagnostics - any key closes"
+
+
+def close_diagnostics():
+    state["diagnostics"] = False
+    state["status_message"] = "Ready"
+
+
 def action_exit():
     state["confirm_exit"] = True
     state["confirm_shutdown"] = False
@@ -515,6 +557,14 @@ class Button:
 buttons = []
 selected_index = 0
 
+# Built once per layout by build_navigation(): neighbors[i][(dx, dy)] is the
+# button a Twiddler move from button i lands on, hit_grid maps a
+# HIT_CELL_SIZE grid cell to the buttons overlapping it.
+NAV_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+HIT_CELL_SIZE = 64
+neighbors = []
+hit_grid = {}
+
 
 def add_button(label, rect, action, color, group=None):
     buttons.append(Button(label, rect, action, color, group))
@@ -540,8 +590,19 @@ def toggle_state_color(state_key):
     return BUTTON_OPEN if state.get(state_key) == "open" else BUTTON_CLOSE
 
 
+def panel_rects(width, height):
+    margin = 30
+    top = 120
+    bottom_h = 135
+    gap = 22
+    col_w = (width - margin * 2 - gap * 3) // 4
+    panel_h = height - top - bottom_h - margin
+    return [pygame.Rect(margin + i * (col_w + gap), top, col_w, panel_h) for i in range(4)]
+
+
 def build_buttons(width, height):
     buttons.clear()
+    build_sprites(width, height)
 
     margin = 30
     top = 120
@@ -556,47 +617,69 @@ def build_buttons(width, height):
     y0 = top + 82
 
     x = col_x[0]
-    add_button("General", (x + 20, y0, col_w - 40, button_h), lambda: action_sound(1), BUTTON_SOUND, "body")
-    add_button("Chatty", (x + 20, y0 + 1 * (button_h + inner_gap), col_w - 40, button_h), lambda: action_sound(2), BUTTON_SOUND, "body")
-    add_button("Whistle", (x + 20, y0 + 2 * (button_h + inner_gap), col_w - 40, button_h), lambda: action_sound(5), BUTTON_SOUND, "body")
-    add_button("Scream", (x + 20, y0 + 3 * (button_h + inner_gap), col_w - 40, button_h), lambda: action_sound(6), BUTTON_SOUND, "body")
-    add_button("Warning", (x + 20, y0 + 4 * (button_h + inner_gap), col_w - 40, button_h), lambda: action_sound(7), BUTTON_SOUND, "body")
-    add_button("Leia", (x + 20, y0 + 5 * (button_h + inner_gap), col_w - 40, button_h), lambda: action_sound(9), BUTTON_SOUND, "body")
+    add_button("General", (x + 20, y0, col_w - 40, button_h), command_action("sound_1"), BUTTON_SOUND, "body")
+    add_button("Chatty", (x + 20, y0 + 1 * (button_h + inner_gap), col_w - 40, button_h), command_action("sound_2"), BUTTON_SOUND, "body")
+    add_button("Whistle", (x + 20, y0 + 2 * (button_h + inner_gap), col_w - 40, button_h), command_action("sound_5"), BUTTON_SOUND, "body")
+    add_button("Scream", (x + 20, y0 + 3 * (button_h + inner_gap), col_w - 40, button_h), command_action("sound_6"), BUTTON_SOUND, "body")
+    add_button("Warning", (x + 20, y0 + 4 * (button_h + inner_gap), col_w - 40, button_h), command_action("sound_7"), BUTTON_SOUND, "body")
+    add_button("Leia", (x + 20, y0 + 5 * (button_h + inner_gap), col_w - 40, button_h), command_action("sound_9"), BUTTON_SOUND, "body")
     add_button("Sound -", (x + 20, y0 + 6 * (button_h + inner_gap), (col_w - 58) // 2, button_h), action_sound_minus, BUTTON_SOUND, "body")
     add_button("Sound +", (x + 20 + (col_w - 58) // 2 + 18, y0 + 6 * (button_h + inner_gap), (col_w - 58) // 2, button_h), action_sound_plus, BUTTON_SOUND, "body")
     add_button("Play Selected", (x + 20, y0 + 7 * (button_h + inner_gap), col_w - 40, button_h), action_play_selected_sound, BUTTON_SOUND, "body")
 
     x = col_x[1]
-    add_button("Open Front", (x + 20, y0, col_w - 40, 66), action_front_open, BUTTON_OPEN, "front")
-    add_button("Close Front", (x + 20, y0 + 80, col_w - 40, 66), action_front_close, BUTTON_CLOSE, "front")
-    add_button("Arm Flail", (x + 20, y0 + 160, col_w - 40, 66), action_front_arm_flail, BUTTON_PRESET, "front")
-    add_button("Charge Bay", (x + 20, y0 + 240, col_w - 40, 66), action_charge_bay_toggle, lambda: toggle_state_color("charge_bay"), "front")
-    add_button("Data Panel", (x + 20, y0 + 320, col_w - 40, 66), action_data_panel_toggle, lambda: toggle_state_color("data_panel"), "front")
-    add_button("Wake Up", (x + 20, y0 + 400, col_w - 40, 66), action_wake_up, BUTTON_PRESET, "front")
+    add_button("Open Front", (x + 20, y0, col_w - 40, 66), command_action("front_open"), BUTTON_OPEN, "front")
+    add_button("Close Front", (x + 20, y0 + 80, col_w - 40, 66), command_action("front_close"), BUTTON_CLOSE, "front")
+    add_button("Arm Flail", (x + 20, y0 + 160, col_w - 40, 66), command_action("arm_flail"), BUTTON_PRESET, "front")
+    add_button("Charge Bay", (x + 20, y0 + 240, col_w - 40, 66), command_action("charge_bay_toggle"), lambda: toggle_state_color("charge_bay"), "front")
+    add_button("Data Panel", (x + 20, y0 + 320, col_w - 40, 66), command_action("data_panel_toggle"), lambda: toggle_state_color("data_panel"), "front")
+    add_button("Wake Up", (x + 20, y0 + 400, col_w - 40, 66), sequence_action("wake_up", "Preset: Wake Up"), BUTTON_PRESET, "front")
 
     x = col_x[2]
-    add_button("Open Rear", (x + 20, y0, col_w - 40, 66), action_rear_open, BUTTON_OPEN, "rear")
-    add_button("Close Rear", (x + 20, y0 + 80, col_w - 40, 66), action_rear_close, BUTTON_CLOSE, "rear")
-    add_button("Rear Top Toggle", (x + 20, y0 + 160, col_w - 40, 66), action_rear_top_toggle, lambda: toggle_state_color("rear_top"), "rear")
-    add_button("Rear Top Open", (x + 20, y0 + 240, col_w - 40, 66), action_rear_top_open, BUTTON_OPEN, "rear")
-    add_button("Rear Top Close", (x + 20, y0 + 320, col_w - 40, 66), action_rear_top_close, BUTTON_CLOSE, "rear")
+    add_button("Open Rear", (x + 20, y0, col_w - 40, 66), command_action("rear_open"), BUTTON_OPEN, "rear")
+    add_button("Close Rear", (x + 20, y0 + 80, col_w - 40, 66), command_action("rear_close"), BUTTON_CLOSE, "rear")
+    add_button("Rear Top Toggle", (x + 20, y0 + 160, col_w - 40, 66), command_action("rear_top_toggle"), lambda: toggle_state_color("rear_top"), "rear")
+    add_button("Rear Top Open", (x + 20, y0 + 240, col_w - 40, 66), command_action("rear_top_open"), BUTTON_OPEN, "rear")
+    add_button("Rear Top Close", (x + 20, y0 + 320, col_w - 40, 66), command_action("rear_top_close"), BUTTON_CLOSE, "rear")
 
     x = col_x[3]
-    add_button("Open Dome", (x + 20, y0, col_w - 40, 86), action_dome_open, BUTTON_OPEN, "dome")
-    add_button("Close Dome", (x + 20, y0 + 106, col_w - 40, 86), action_dome_close, BUTTON_CLOSE, "dome")
-    add_button("Dome Wave", (x + 20, y0 + 232, col_w - 40, 86), action_dome_wave, BUTTON_PRESET, "dome")
-    add_button("Warn + Open", (x + 20, y0 + 338, col_w - 40, 86), action_warning_all_open, BUTTON_PRESET, "dome")
+    add_button("Open Dome", (x + 20, y0, col_w - 40, 86), command_action("dome_open"), BUTTON_OPEN, "dome")
+    add_button("Close Dome", (x + 20, y0 + 106, col_w - 40, 86), command_action("dome_close"), BUTTON_CLOSE, "dome")
+    add_button("Dome Wave", (x + 20, y0 + 232, col_w - 40, 86), command_action("dome_wave"), BUTTON_PRESET, "dome")
+    add_button("Warn + Open", (x + 20, y0 + 338, col_w - 40, 86), sequence_action("warning_all_open", "Preset: Warning + Open All"), BUTTON_PRESET, "dome")
 
     by = height - bottom_h + 25
     bw = (width - margin * 2 - gap * 5) // 6
 
-    add_button("Open All", (margin, by, bw, 88), action_open_all, BUTTON_OPEN, "global")
-    add_button("Close All", (margin + 1 * (bw + gap), by, bw, 88), action_close_all, BUTTON_CLOSE, "global")
+    add_button("Open All", (margin, by, bw, 88), sequence_action("open_all", "Sent: Open All"), BUTTON_OPEN, "global")
+    add_button("Close All", (margin + 1 * (bw + gap), by, bw, 88), sequence_action("close_all", "Sent: Close All"), BUTTON_CLOSE, "global")
     add_button(wifi_button_label, (margin + 2 * (bw + gap), by, bw, 88), action_wifi_toggle, wifi_button_color, "global")
-    add_button("Status", (margin + 3 * (bw + gap), by, bw, 88), lambda: None, BUTTON_SYSTEM, "global")
+    add_button("Status", (margin + 3 * (bw + gap), by, bw, 88), action_status, BUTTON_SYSTEM, "global")
     add_button("Shutdown", (margin + 4 * (bw + gap), by, bw, 88), action_shutdown, BUTTON_DANGER, "global")
     add_button("EXIT", (margin + 5 * (bw + gap), by, bw, 88), action_exit, BUTTON_DANGER, "global")
 
+    build_navigation()
+
+
+def build_navigation():
+    neighbors.clear()
+    for i in range(len(buttons)):
+        neighbors.append({direction: find_neighbor(i, *direction) for direction in NAV_DIRECTIONS})
+
+    hit_grid.clear()
+    for i, b in enumerate(buttons):
+        for gx in range(b.rect.left // HIT_CELL_SIZE, (b.rect.right - 1) // HIT_CELL_SIZE + 1):
+            for gy in range(b.rect.top // HIT_CELL_SIZE, (b.rect.bottom - 1) // HIT_CELL_SIZE + 1):
+                hit_grid.setdefault((gx, gy), []).append(i)
+
+
+def button_at(pos):
+    # Cells list buttons in index order, so overlaps resolve like a full scan.
+    for i in hit_grid.get((pos[0] // HIT_CELL_SIZE, pos[1] // HIT_CELL_SIZE), ()):
+        if buttons[i].rect.collidepoint(pos):
+            return i
+    return None
+
 
 def panel_header_color(area):
     value = state.get(area, "unknown")
@@ -607,8 +690,15 @@ def panel_header_color(area):
     return PANEL_HEADER
 
 
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(text, font, color):
+    # Labels repeat every frame, so rendered surfaces are cached by
+    # (text, font, color). render_text.cache_info() has the hit/miss counts.
+    return font.render(text, True, color)
+
+
 def draw_text(screen, text, font, color, center=None, topleft=None):
-    surf = font.render(text, True, color)
+    surf = render_text(text, font, color)
     rect = surf.get_rect()
     if center:
         rect.center = center
@@ -617,35 +707,96 @@ def draw_text(screen, text, font, color, center=None, topleft=None):
     screen.blit(surf, rect)
 
 
+# Pre-rendered layers. The background holds everything that never changes
+# (screen fill and panel bodies); rounded headers and buttons are sprites
+# keyed by what they look like, so a frame is mostly blits.
+background = None
+sprites = {}
+
+
+def build_sprites(width, height):
+    global background
+
+    sprites.clear()
+    background = pygame.Surface((width, height))
+    background.fill(BG)
+    for rect in panel_rects(width, height):
+        pygame.draw.rect(background, PANEL, rect, border_radius=22)
+
+    if pygame.display.get_surface() is not None:
+        background = background.convert()
+
+
+def new_sprite(size):
+    sprite = pygame.Surface(size, pygame.SRCALPHA)
+    if pygame.display.get_surface() is not None:
+        sprite = sprite.convert_alpha()
+    return sprite
+
+
+def panel_header_sprite(width, header_color):
+    key = ("header", width, header_color)
+    sprite = sprites.get(key)
+    if sprite is None:
+        sprite = new_sprite((width, 70))
+        pygame.draw.rect(sprite, header_color, (0, 0, width, 58), border_radius=22)
+        pygame.draw.rect(sprite, header_color, (0, 30, width, 40))
+        sprites[key] = sprite
+    return sprite
+
+
+def button_sprite(size, color, selected):
+    key = ("button", size, color, selected)
+    sprite = sprites.get(key)
+    if sprite is None:
+        sprite = new_sprite(size)
+        rect = sprite.get_rect()
+        pygame.draw.rect(sprite, color, rect, border_radius=18)
+        if selected:
+            pygame.draw.rect(sprite, SELECTED, rect, width=6, border_radius=18)
+        sprites[key] = sprite
+    return sprite
+
+
 def draw_panel(screen, rect, title, subtitle, font_title, font_small, header_color=PANEL_HEADER):
-    pygame.draw.rect(screen, PANEL, rect, border_radius=22)
-    header = pygame.Rect(rect.x, rect.y, rect.w, 58)
-    pygame.draw.rect(screen, header_color, header, border_radius=22)
-    pygame.draw.rect(screen, header_color, (rect.x, rect.y + 30, rect.w, 40))
+    # The panel body itself is part of the background layer.
+    screen.blit(panel_header_sprite(rect.w, header_color), rect.topleft)
     draw_text(screen, title, font_title, TEXT, center=(rect.centerx, rect.y + 28))
     draw_text(screen, subtitle, font_small, TEXT_DIM, center=(rect.centerx, rect.y + 62))
 
 
 def draw_button(screen, button, font_button, selected=False):
-    pygame.draw.rect(screen, button.color, button.rect, border_radius=18)
-    if selected:
-        pygame.draw.rect(screen, SELECTED, button.rect, width=6, border_radius=18)
+    screen.blit(button_sprite(button.rect.size, button.color, selected), button.rect.topleft)
     draw_text(screen, button.label, font_button, TEXT, center=button.rect.center)
 
 
+def confirm_dialog_text():
+    if state["confirm_shutdown"]:
+        return "CONFIRM SHUTDOWN", "This will safely shut down the Raspberry Pi."
+    if state["confirm_exit"]:
+        return "CONFIRM EXIT", "This exits the UI but leaves the Pi running."
+    if state["confirm_wifi_off"]:
+        return "TURN WIFI OFF?", "SSH/Raspberry Pi Connect will disconnect."
+    return None
+
+
+def confirm_dialog_rects(width, height):
+    overlay = pygame.Rect(width // 2 - 430, height // 2 - 160, 860, 320)
+    yes_rect = pygame.Rect(width // 2 - 260, height // 2 + 35, 220, 88)
+    no_rect = pygame.Rect(width // 2 + 40, height // 2 + 35, 220, 88)
+    return overlay, yes_rect, no_rect
+
+
 def draw_confirm_dialog(screen, title, message, font_title, font_button, font_small):
     width, height = screen.get_size()
+    overlay, yes_rect, no_rect = confirm_dialog_rects(width, height)
 
-    overlay = pygame.Rect(width // 2 - 430, height // 2 - 160, 860, 320)
     pygame.draw.rect(screen, (68, 30, 34), overlay, border_radius=24)
     pygame.draw.rect(screen, SELECTED, overlay, width=6, border_radius=24)
 
     draw_text(screen, title, font_title, TEXT, center=(width // 2, height // 2 - 90))
     draw_text(screen, message, font_small, TEXT_DIM, center=(width // 2, height // 2 - 35))
 
-    yes_rect = pygame.Rect(width // 2 - 260, height // 2 + 35, 220, 88)
-    no_rect = pygame.Rect(width // 2 + 40, height // 2 + 35, 220, 88)
-
     pygame.draw.rect(screen, BUTTON_CONFIRM, yes_rect, border_radius=18)
     pygame.draw.rect(screen, BUTTON_CANCEL, no_rect, border_radius=18)
 
@@ -655,12 +806,137 @@ def draw_confirm_dialog(screen, title, message, font_title, font_button, font_sm
     return yes_rect, no_rect
 
 
-def draw_ui(screen, fonts):
-    width, height = screen.get_size()
-    screen.fill(BG)
+def diagnostics_rect(width, height):
+    # Covers the four panels, leaves the header and bottom row visible.
+    return panel_rects(width, height)[0].union(panel_rects(width, height)[3])
+
+
+def format_latency(summary):
+    if summary is None:
+        return "-"
+    count, p50, p95, p99 = summary
+    return f"{p50 * 1000:.0f} / {p95 * 1000:.0f} / {p99 * 1000:.0f}  ({count})"
+
+
+def format_percent(share):
+    return "off" if share is None else f"{share:.1%}"
+
+
+def format_csma():
+    timeouts = f"ACK timeouts {radio.ack_timeouts}"
+    if csma is None:
+        return ("Carrier sense", "off", "", "", timeouts)
+    return (
+        "Carrier sense",
+        f"Above {csma.threshold:.0f} dBm",
+        f"Backoffs {csma.busy} / {csma.backoff_seconds * 1000:.0f} ms",
+        f"Forced {csma.forced}",
+        timeouts,
+    )
+
+
+def format_power():
+    # The last two TX power changes, newest first.
+    if power is None:
+        return ("TX power fixed", "", "", "", "")
+    row = (f"TX power {TX_POWER_MODE}",)
+    for node, old, new, reason in reversed(list(power.decisions)[-2:]):
+        row += (f"{NODE_NAMES.get(node, node)} {old} > {new} dBm", reason)
+    if len(row) == 1:
+        row += ("No changes yet",)
+    return row
+
+
+def format_link(summary):
+    def value(v, fmt, scale=1):
+        return "-" if v is None else format(v * scale, fmt)
+
+    name = summary.name
+    if power is not None:
+        name = f"{name} {power.power_for(summary.node)} dBm"
+
+    return (
+        str(summary.node),
+        name,
+        f"{value(summary.rssi, '.0f')} / {value(summary.rssi_avg, '.0f')}",
+        f"{value(summary.loss, '.0%')} / {value(summary.rx_retry_rate, '.0%')}",
+        f"{value(summary.tx_attempts, '.2f')} / {value(summary.tx_fail_rate, '.0%')}",
+        f"{value(summary.gap_avg, '.0f', 1000)} / {value(summary.gap_jitter, '.0f', 1000)}",
+    )
 
+
+def diagnostics_sections():
+    # (title, column positions as fractions of the width, header + rows)
+    link_rows = [("Node", "Name, TX dBm", "RSSI last / avg", "Lost / RX retried", "TX tries / failed", "Gap ms avg / jitter")]
+    link_rows += [format_link(summary) for summary in link.summaries()]
+
+    latency_rows = [("Node", "Command", "Key > queued", "Queued > on air", "On air > reply")]
+    for node, label, stages in latency.summary():
+        latency_rows.append((str(node), label) + tuple(format_latency(stages[stage]) for stage in LATENCY_STAGES))
+    if len(latency_rows) == 1:
+        latency_rows.append(("", "No commands sent yet"))
+
+    # Queue counters, then channel use over the airtime window: all of it,
+    # the Pi's own packets, and each node's as heard by the Pi.
+    tx_rows = (
+        ("Queued / peak", "Coalesced / drop", "Channel / peak", "Pi TX / budget", "Paced"),
+        (
+            f"{radio.tx_depth} / {radio.tx_peak_depth}",
+            f"{radio.tx_coalesced} / {radio.tx_dropped}",
+            f"{format_percent(airtime.utilization())} / {format_percent(airtime.peak)}",
+            f"{format_percent(airtime.tx_utilization())} / {format_percent(airtime.budget)}",
+            str(radio.tx_paced),
+        ),
+        ("Heard",) + tuple(f"{NODE_NAMES[node]} {format_percent(airtime.rx_utilization(node))}" for node in sorted(NODE_NAMES)),
+        format_csma(),
+        format_power(),
+    )
+
+    return (
+        (f"LINK QUALITY  last {LINK_WINDOW} packets per node", (0.0, 0.07, 0.24, 0.41, 0.61, 0.80), tuple(link_rows)),
+        (
+            f"TX QUEUE  up to {TX_QUEUE_LIMIT} per node   AIRTIME  last {AIRTIME_WINDOW_SECONDS:g} s",
+            (0.0, 0.2, 0.4, 0.6, 0.8),
+            tx_rows,
+        ),
+        ("COMMAND LATENCY  ms p50 / p95 / p99  (samples)", (0.0, 0.08, 0.34, 0.56, 0.78), tuple(latency_rows)),
+    )
+
+
+def diagnostics_key():
+    if not state["diagnostics"]:
+        return None
+    return diagnostics_sections()
+
+
+def draw_diagnostics(screen, fonts):
+    if not state["diagnostics"]:
+        return
     title_font, header_font, small_font, button_font, status_font = fonts
+    width, height = screen.get_size()
+    rect = diagnostics_rect(width, height)
 
+    pygame.draw.rect(screen, PANEL, rect, border_radius=18)
+    pygame.draw.rect(screen, SELECTED, rect, width=4, border_radius=18)
+
+    row_h = 34
+    y = rect.y + 18
+    for title, columns, rows in diagnostics_sections():
+        if y + 58 + row_h > rect.bottom - 16:
+            break
+        draw_text(screen, title, header_font, TEXT, topleft=(rect.x + 24, y))
+        y += 58
+        max_rows = (rect.bottom - y - 16) // row_h
+        for n, row in enumerate(rows[:max_rows]):
+            color = TEXT_DIM if n == 0 else TEXT
+            for column, cell in zip(columns, row):
+                draw_text(screen, cell, status_font, color, topleft=(rect.x + 24 + int(column * (rect.w - 48)), y))
+            y += row_h
+        y += 24
+
+
+def draw_header(screen, title_font, status_font):
+    width = screen.get_width()
     draw_text(screen, "R2N2 FIELD CONTROL", title_font, TEXT, topleft=(30, 22))
 
     radio_status = (
@@ -669,7 +945,9 @@ def draw_ui(screen, fonts):
     )
     draw_text(screen, radio_status, status_font, STATUS_OK, topleft=(width - 860, 34))
 
-    status_bar = pygame.Rect(30, 78, width - 60, 34)
+
+def draw_status_bar(screen, status_font):
+    status_bar = pygame.Rect(30, 78, screen.get_width() - 60, 34)
     pygame.draw.rect(screen, (20, 24, 32), status_bar, border_radius=10)
     draw_text(
         screen,
@@ -679,88 +957,126 @@ def draw_ui(screen, fonts):
         topleft=(48, 84),
     )
 
-    margin = 30
-    top = 120
-    bottom_h = 135
-    gap = 22
-    col_w = (width - margin * 2 - gap * 3) // 4
-    panel_h = height - top - bottom_h - margin
-    col_x = [margin + i * (col_w + gap) for i in range(4)]
 
-    selected_bank = state["selected_sound"]
+class Region:
+    # A fixed area of the screen plus the inputs it is drawn from. It is
+    # only redrawn when key_func() returns something different.
+    def __init__(self, rect, key_func, draw_func):
+        self.rect = pygame.Rect(rect)
+        self.key_func = key_func
+        self.draw_func = draw_func
+        self.last_key = None
+        self.valid = False
 
-    draw_panel(
-        screen,
-        pygame.Rect(col_x[0], top, col_w, panel_h),
-        "BODY / SOUNDS",
-        f"Selected: {selected_bank} {sound_label(selected_bank)}",
-        header_font,
-        small_font,
-        PANEL_HEADER,
-    )
-    draw_panel(
-        screen,
-        pygame.Rect(col_x[1], top, col_w, panel_h),
-        "FRONT",
-        f"State: {state['front']}",
-        header_font,
-        small_font,
-        panel_header_color("front"),
-    )
-    draw_panel(
-        screen,
-        pygame.Rect(col_x[2], top, col_w, panel_h),
-        "REAR",
-        f"State: {state['rear']}",
-        header_font,
-        small_font,
-        panel_header_color("rear"),
+
+regions = []
+
+
+def add_region(rect, key_func, draw_func):
+    regions.append(Region(rect, key_func, draw_func))
+
+
+def invalidate_all():
+    for region in regions:
+        region.valid = False
+
+
+def build_regions(width, height, fonts):
+    # Regions are listed back to front; a dirty region is repainted by
+    # redrawing everything that overlaps it, clipped to its rect.
+    regions.clear()
+
+    title_font, header_font, small_font, button_font, status_font = fonts
+
+    if background is None or background.get_size() != (width, height):
+        build_sprites(width, height)
+
+    add_region((0, 0, width, height), lambda: None, lambda screen: screen.blit(background, (0, 0)))
+    add_region(
+        (0, 0, width, 78),
+        lambda: (state["wifi_status"], state["last_rx"], state["last_rssi"]),
+        lambda screen: draw_header(screen, title_font, status_font),
     )
-    draw_panel(
-        screen,
-        pygame.Rect(col_x[3], top, col_w, panel_h),
-        "DOME",
-        f"State: {state['dome']}",
-        header_font,
-        small_font,
-        panel_header_color("dome"),
+    add_region(
+        (0, 78, width, 34),
+        lambda: (state["last_command"], state["status_message"]),
+        lambda screen: draw_status_bar(screen, status_font),
     )
 
+    panels = [
+        (
+            "BODY / SOUNDS",
+            lambda: f"Selected: {state['selected_sound']} {sound_label(state['selected_sound'])}",
+            lambda: PANEL_HEADER,
+        ),
+        ("FRONT", lambda: f"State: {state['front']}", lambda: panel_header_color("front")),
+        ("REAR", lambda: f"State: {state['rear']}", lambda: panel_header_color("rear")),
+        ("DOME", lambda: f"State: {state['dome']}", lambda: panel_header_color("dome")),
+    ]
+
+    for rect, (title, subtitle_func, color_func) in zip(panel_rects(width, height), panels):
+        add_region(
+            rect,
+            lambda s=subtitle_func, c=color_func: (s(), c()),
+            lambda screen, r=rect, t=title, s=subtitle_func, c=color_func: draw_panel(
+                screen, r, t, s(), header_font, small_font, c()
+            ),
+        )
+
     for i, button in enumerate(buttons):
-        draw_button(screen, button, button_font, selected=(i == selected_index))
+        add_region(
+            button.rect,
+            lambda i=i, b=button: (b.label, b.color, i == selected_index),
+            lambda screen, i=i, b=button: draw_button(screen, b, button_font, selected=(i == selected_index)),
+        )
 
-    yes_rect = None
-    no_rect = None
+    add_region(diagnostics_rect(width, height), diagnostics_key, lambda screen: draw_diagnostics(screen, fonts))
+
+    overlay, yes_rect, no_rect = confirm_dialog_rects(width, height)
+    add_region(overlay, confirm_dialog_text, lambda screen: draw_dialog(screen, fonts))
 
-    if state["confirm_shutdown"]:
-        yes_rect, no_rect = draw_confirm_dialog(
-            screen,
-            "CONFIRM SHUTDOWN",
-            "This will safely shut down the Raspberry Pi.",
-            header_font,
-            button_font,
-            small_font,
-        )
-    elif state["confirm_exit"]:
-        yes_rect, no_rect = draw_confirm_dialog(
-            screen,
-            "CONFIRM EXIT",
-            "This exits the UI but leaves the Pi running.",
-            header_font,
-            button_font,
-            small_font,
-        )
-    elif state["confirm_wifi_off"]:
-        yes_rect, no_rect = draw_confirm_dialog(
-            screen,
-            "TURN WIFI OFF?",
-            "SSH/Raspberry Pi Connect will disconnect.",
-            header_font,
-            button_font,
-            small_font,
-        )
 
-    pygame.display.flip()
+def draw_dialog(screen, fonts):
+    text = confirm_dialog_text()
+    if text is None:
+        return
+    title_font, header_font, small_font, button_font, status_font = fonts
+    draw_confirm_dialog(screen, text[0], text[1], header_font, button_font, small_font)
+
+
+def draw_ui(screen, fonts):
+    width, height = screen.get_size()
+    if not regions or regions[0].rect.size != (width, height):
+        build_regions(width, height, fonts)
+
+    if RENDER_MODE != "dirty":
+        invalidate_all()
+
+    full = not regions[0].valid
+    dirty = []
+    for region in regions:
+        key = region.key_func()
+        if not region.valid or key != region.last_key:
+            region.last_key = key
+            region.valid = True
+            dirty.append(region.rect)
+
+    if full:
+        for region in regions:
+            region.draw_func(screen)
+        pygame.display.flip()
+    elif dirty:
+        for rect in dirty:
+            screen.set_clip(rect)
+            for region in regions:
+                if region.rect.colliderect(rect):
+                    region.draw_func(screen)
+        screen.set_clip(None)
+        pygame.display.update(dirty)
+
+    if confirm_dialog_text() is None:
+        return None, None
+    overlay, yes_rect, no_rect = confirm_dialog_rects(width, height)
     return yes_rect, no_rect
 
 
@@ -774,7 +1090,15 @@ def move_selection(dx, dy):
     if not buttons:
         return
 
-    current = buttons[selected_index]
+    direction = (dx, dy)
+    if direction in neighbors[selected_index]:
+        selected_index = neighbors[selected_index][direction]
+    else:
+        selected_index = find_neighbor(selected_index, dx, dy)
+
+
+def find_neighbor(index, dx, dy):
+    current = buttons[index]
     cx, cy = button_center(current)
 
     # -----------------------------
@@ -784,7 +1108,7 @@ def move_selection(dx, dy):
         same_column = []
 
         for i, b in enumerate(buttons):
-            if i == selected_index:
+            if i == index:
                 continue
 
             bx, by = button_center(b)
@@ -798,8 +1122,7 @@ def move_selection(dx, dy):
 
         if same_column:
             same_column.sort()
-            selected_index = same_column[0][1]
-            return
+            return same_column[0][1]
 
         # If moving down out of a column, jump to first bottom-row item.
         if dy > 0:
@@ -807,8 +1130,7 @@ def move_selection(dx, dy):
                 [(b.rect.y, b.rect.x, i) for i, b in enumerate(buttons) if b.group == "global"]
             )
             if bottom_items:
-                selected_index = bottom_items[0][2]
-            return
+                return bottom_items[0][2]
 
         # If moving up from bottom row, go to nearest item above in same-ish x range.
         if dy < 0 and current.group == "global":
@@ -825,9 +1147,7 @@ def move_selection(dx, dy):
 
             if candidates:
                 candidates.sort()
-                selected_index = candidates[0][1]
-
-            return
+                return candidates[0][1]
 
     # -----------------------------
     # LEFT / RIGHT: move across same row
@@ -836,7 +1156,7 @@ def move_selection(dx, dy):
         same_row = []
 
         for i, b in enumerate(buttons):
-            if i == selected_index:
+            if i == index:
                 continue
 
             bx, by = button_center(b)
@@ -850,8 +1170,7 @@ def move_selection(dx, dy):
 
         if same_row:
             same_row.sort()
-            selected_index = same_row[0][1]
-            return
+            return same_row[0][1]
 
         # If there is nothing to the right on that row,
         # jump to the top item in the next column to the right.
@@ -868,8 +1187,7 @@ def move_selection(dx, dy):
                 nearest_x = min(x for x, y, i in right_columns)
                 column_items = [(y, i) for x, y, i in right_columns if abs(x - nearest_x) < 90]
                 column_items.sort()
-                selected_index = column_items[0][1]
-            return
+                return column_items[0][1]
 
         # If there is nothing to the left on that row,
         # jump to the top item in the previous column to the left.
@@ -885,8 +1203,9 @@ def move_selection(dx, dy):
                 nearest_x = max(x for x, y, i in left_columns)
                 column_items = [(y, i) for x, y, i in left_columns if abs(x - nearest_x) < 90]
                 column_items.sort()
-                selected_index = column_items[0][1]
-            return
+                return column_items[0][1]
+
+    return index
 
 
 def activate_selected():
@@ -897,6 +1216,9 @@ def activate_selected():
 def handle_confirm_yes():
     if state["confirm_shutdown"]:
         oled("R2N2 Control", "Shutting down", "")
+        oled_writer.flush()
+        if event_log is not None:
+            event_log.flush()
         pygame.quit()
         os.system("sudo shutdown now")
         return "shutdown"
@@ -928,24 +1250,55 @@ def handle_mouse_click(pos, yes_rect, no_rect):
             cancel_confirm()
         return None
 
-    for i, b in enumerate(buttons):
-        if b.rect.collidepoint(pos):
-            selected_index = i
-            activate_selected()
-            break
+    if state["diagnostics"]:
+        close_diagnostics()
+        return None
+
+    i = button_at(pos)
+    if i is not None:
+        selected_index = i
+        activate_selected()
 
     return None
 
 
+WAKE_EVENT = pygame.USEREVENT + 1
+
+
+def wake_ui():
+    # Called from the radio and system threads; SDL's event queue is
+    # thread safe, so posting an event is enough to end event.wait().
+    try:
+        pygame.event.post(pygame.event.Event(WAKE_EVENT))
+    except pygame.error:
+        pass
+
+
+def frame_timeout_ms(last_activity):
+    if time.monotonic() - last_activity < IDLE_AFTER_SECONDS:
+        return int(1000 / FPS)
+    return int(1000 / IDLE_FPS)
+
+
 def main():
-    global selected_index
+    global selected_index, input_at
 
     time.sleep(STARTUP_DELAY_SECONDS)
+    oled_writer.start()
     oled("R2N2 GUI", "Starting", "Radio ready")
+    executor.start()
     update_wifi_status()
+    if WIFI_STATUS_MODE == "monitor":
+        network_monitor.start()
+    if event_log is not None:
+        event_log.start()
+    radio.start()
 
     pygame.init()
     pygame.mouse.set_visible(True)
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    radio.on_event = wake_ui
+    executor.on_result = wake_ui
 
     screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     pygame.display.set_caption("R2N2 Field Control")
@@ -960,28 +1313,46 @@ def main():
     button_font = pygame.font.SysFont(None, 34)
     status_font = pygame.font.SysFont(None, 30)
     fonts = (title_font, header_font, small_font, button_font, status_font)
+    build_regions(width, height, fonts)
 
     clock = pygame.time.Clock()
     running = True
     yes_rect = None
     no_rect = None
     last_wifi_status_check = 0
+    last_activity = time.monotonic()
+    woke_at = last_activity
+    woken_by = []
 
     while running:
-        receive_once()
+        process_radio_events()
+
+        executor.poll()
 
+        # With the monitor running this is only a slow safety net.
+        wifi_poll = WIFI_MONITOR_POLL_SECONDS if network_monitor.is_alive() else WIFI_POLL_SECONDS
         now = time.monotonic()
-        if now - last_wifi_status_check > 5:
+        if now - last_wifi_status_check > wifi_poll:
             update_wifi_status()
             last_wifi_status_check = now
 
-        for event in pygame.event.get():
+        # Input latency is measured from when event.wait() returned, so time
+        # spent on radio and system results above is included.
+        picked_up_at = woke_at if woken_by else time.monotonic()
+        for event in woken_by + pygame.event.get():
+            if event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
+                input_at = picked_up_at
+
             if event.type == pygame.QUIT:
                 running = False
 
             elif event.type == pygame.KEYDOWN:
                 key = event.key
 
+                if state["diagnostics"]:
+                    close_diagnostics()
+                    continue
+
                 # Twiddler navigation only:
                 # A = left, E = right, B = up, C = down, D = select/confirm
                 if key in (pygame.K_a, pygame.K_LEFT):
@@ -1017,11 +1388,26 @@ def main():
                 if result in ("exit", "shutdown"):
                     running = False
 
+        input_at = None
         yes_rect, no_rect = draw_ui(screen, fonts)
-        clock.tick(FPS)
 
+        if ADAPTIVE_FRAMES:
+            event = pygame.event.wait(frame_timeout_ms(last_activity))
+            woke_at = time.monotonic()
+            woken_by = [] if event.type == pygame.NOEVENT else [event]
+            if woken_by:
+                last_activity = time.monotonic()
+        else:
+            clock.tick(FPS)
+
+    radio.stop()
+    if event_log is not None:
+        event_log.stop()
+    network_monitor.stop()
+    executor.stop()
     pygame.quit()
     oled("R2N2 Control", "Stopped", "")
+    oled_writer.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""
+Packet codec check and bench
+Round-trips RadioHead headers and PanelCommand bodies through r2n2_codec,
+then compares decode/encode throughput with the old slice-and-index code.
+The radio only encodes payloads, once when the command table is built;
+the driver adds the header on send.
+Runs without the radio.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from r2n2_codec import (
+    ACTION_MULTI_COMMAND,
+    MULTI_COMMAND_MAX,
+    PANEL_COMMAND_LEN,
+    RH_HEADER,
+    PanelCommand,
+    decode_frame,
+    decode_header,
+    decode_multi_command,
+    decode_panel_command,
+    multi_command,
+    panel_command,
+)
+
+ROUNDS = 200000
+
+
+def check_round_trip():
+    random.seed(16)
+
+    for _ in range(5000):
+        header = tuple(random.randrange(256) for _ in range(4))
+        fields = tuple(random.randrange(256) for _ in range(4))
+        body = bytes(random.randrange(256) for _ in range(random.randint(0, 60)))
+
+        frame = RH_HEADER.pack(*header) + body
+        assert decode_header(frame) == header
+        dest, sender, ident, flags, view = decode_frame(frame)
+        assert (dest, sender, ident, flags) == header and bytes(view) == body
+
+        assert panel_command(*fields) == bytes(fields)
+        decoded = decode_frame(RH_HEADER.pack(*header) + panel_command(*fields))
+        assert decoded[:4] == header
+        assert decode_panel_command(decoded[4]) == PanelCommand(*fields)
+
+    for count in range(1, MULTI_COMMAND_MAX + 1):
+        commands = [PanelCommand(*(random.randrange(256) for _ in range(4))) for _ in range(count)]
+        body = multi_command([panel_command(*cmd) for cmd in commands])
+        assert len(body) == (count + 1) * PANEL_COMMAND_LEN <= 60
+        assert decode_multi_command(body) == commands
+        assert decode_multi_command(body[:-1]) is None
+    assert decode_multi_command(bytes([ACTION_MULTI_COMMAND, 2, 1, 0, 2, 255, 1, 0])) is None
+    assert decode_multi_command(panel_command(2, 255, 1)) is None
+
+    assert decode_frame(b"\x01\x02\x03") is None
+    assert decode_panel_command(b"\x40\x14\x01") is None
+    assert decode_panel_command(b"\x00\x40\x14\x01\x28", offset=1) == PanelCommand(0x40, 0x14, 0x01, 0x28)
+    print("round trip ok")
+
+
+def old_decode(pkt):
+    header = pkt[:4]
+    body = bytes(pkt[4:])
+    return header[0], header[1], header[2], header[3], body
+
+
+def old_encode(action, group, position):
+    return bytes([action, group, position, 0])
+
+
+def bench(name, func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:24s} {ROUNDS / elapsed / 1000:8.0f} k/s")
+
+
+check_round_trip()
+
+packet = bytearray([99, 10, 7, 0, 0x40, 0x14, 0x01, 0x28])
+print("decode:")
+bench("slice + index", lambda: old_decode(packet))
+bench("decode_frame", lambda: decode_frame(packet))
+bench("decode_frame + command", lambda: decode_panel_command(decode_frame(packet)[4]))
+print("encode:")
+bench("bytes([...])", lambda: old_encode(2, 255, 1))
+bench("panel_command", lambda: panel_command(2, 255, 1))
@@ -0,0 +1,153 @@
+"""
+Carrier sense bench
+Runs the real RadioWorker against the simulated channel from
+group_node_standin.py while a stand-in Body Feather sends STEALTH status
+bursts, and counts what the Pi's commands to the Front panel cost with and
+without listen-before-talk: frames lost to collisions, ACK timeouts,
+retries, failures and the time from queueing a command to its ACK.
+
+Carrier sense only catches a frame that is already on air. One that starts
+while the Pi's command is going out still collides, and so do ACKs, which
+go out without listening on either side.
+
+    python3 csma_bench.py
+"""
+
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from group_node_standin import SimChannel, SimRadio, StandInNode, percentile
+from r2n2_commands import ACTION_STATUS_UPDATE, BODY_NODE, COMMANDS, FRONT_NODE, PI_NODE
+from r2n2_csma import CarrierSense
+from r2n2_codec import RH_FLAGS_ACK, RH_FLAGS_RETRY, decode_frame, panel_command
+from r2n2_radio import RadioWorker
+
+COMMANDS_SENT = 300
+COMMAND_SPACING = (0.05, 0.15)
+# Body relaying STEALTH status: a few packets, each sent with sendtoWait()
+# a couple of ms after the last one was ACKed.
+BURST_PACKETS = (3, 6)
+BURST_GAP_SECONDS = (0.001, 0.003)
+BURST_SPACING = (0.04, 0.12)
+RH_TIMEOUT_SECONDS = 0.2
+RH_RETRIES = 3
+NOISE_FLOOR_DBM = -100
+SIGNAL_DBM = -50
+
+
+class CountingChannel(SimChannel):
+    # Tallies collided frames by (sender, "cmd" or "ack").
+    def __init__(self, loss=0.0):
+        super().__init__(loss)
+        self.collided = {}
+
+    def transmit(self, sender, frame):
+        tx = super().transmit(sender, frame)
+        if tx["collided"]:
+            key = (sender.node, "ack" if frame[3] & RH_FLAGS_ACK else "cmd")
+            self.collided[key] = self.collided.get(key, 0) + 1
+        return tx
+
+
+class CarrierRadio(SimRadio):
+    # RSSI read the way the RFM69 register behaves while listening: the
+    # signal level while anyone else's frame is on air, otherwise noise.
+    @property
+    def rssi(self):
+        now = time.monotonic()
+        if any(tx["end"] > now for tx in self.channel.on_air):
+            return SIGNAL_DBM + random.uniform(-3, 3)
+        return NOISE_FLOOR_DBM + random.uniform(-3, 3)
+
+    @rssi.setter
+    def rssi(self, value):
+        pass
+
+
+def send_to_wait(radio, dest, data, ident, stats):
+    # RHReliableDatagram::sendtoWait() with RadioHead's defaults: 200 ms
+    # timeout plus up to the same again at random, 3 retries.
+    for attempt in range(RH_RETRIES + 1):
+        flags = RH_FLAGS_RETRY if attempt else 0
+        radio.send(data, destination=dest, node=radio.node, identifier=ident, flags=flags)
+        if attempt:
+            stats["retries"] += 1
+        deadline = time.monotonic() + RH_TIMEOUT_SECONDS + random.uniform(0, RH_TIMEOUT_SECONDS)
+        while time.monotonic() < deadline:
+            frame = radio.receive(deadline - time.monotonic())
+            decoded = frame is not None and decode_frame(frame)
+            if decoded and decoded[1] == dest and decoded[2] == ident and decoded[3] & RH_FLAGS_ACK:
+                return True
+    stats["failed"] += 1
+    return False
+
+
+def status_bursts(radio, stopping, stats):
+    ident = 0
+    while not stopping.is_set():
+        time.sleep(random.uniform(*BURST_SPACING))
+        for n in range(random.randint(*BURST_PACKETS)):
+            ident = (ident + 1) & 0xFF
+            stats["sent"] += 1
+            send_to_wait(radio, PI_NODE, panel_command(ACTION_STATUS_UPDATE, 1, 2, 0), ident, stats)
+            time.sleep(random.uniform(*BURST_GAP_SECONDS))
+
+
+def run(name, carrier_sense):
+    random.seed(25)
+    channel = CountingChannel()
+    front = StandInNode(SimRadio(channel, FRONT_NODE), FRONT_NODE)
+    front.start()
+    body = SimRadio(channel, BODY_NODE)
+    stopping = threading.Event()
+    body_stats = {"sent": 0, "retries": 0, "failed": 0}
+    threading.Thread(target=status_bursts, args=(body, stopping, body_stats), daemon=True).start()
+
+    pi = CarrierRadio(channel, PI_NODE)
+    csma = None
+    if carrier_sense:
+        csma = CarrierSense()
+        csma.calibrate(lambda: pi.rssi)
+    worker = RadioWorker(pi, PI_NODE, node_gap=0.0, tx_gap=0.0, ack_retries=3, trace=False, csma=csma)
+    results = []
+    worker.start()
+
+    cmd = COMMANDS["charge_bay_toggle"]
+    for n in range(COMMANDS_SENT):
+        worker.send(cmd.label, cmd.dest, cmd.payload, on_done=results.append)
+        time.sleep(random.uniform(*COMMAND_SPACING))
+        worker.poll_done()
+    deadline = time.monotonic() + 3.0
+    while len(results) < COMMANDS_SENT and time.monotonic() < deadline:
+        time.sleep(0.01)
+        worker.poll_done()
+
+    stopping.set()
+    worker.stop()
+    front.stopping.set()
+
+    outcome = worker.outcome_for(FRONT_NODE)
+    waits = [(r.done_at - r.cmd.queued_at) * 1000 for r in results if r.acked]
+    line = (
+        f"  {name:14s} ACK timeouts {worker.ack_timeouts:3d}  retries {outcome['retries']:3d}  failed {outcome['failed']:2d}"
+        f"  to ACK ms p50 {statistics.median(waits):5.1f} p95 {percentile(waits, 95):5.1f}"
+    )
+    lost = channel.collided
+    line += f"\n{'':16s} collided: Pi commands {lost.get((PI_NODE, 'cmd'), 0)}, Pi ACKs {lost.get((PI_NODE, 'ack'), 0)}"
+    line += f", Front ACKs {lost.get((FRONT_NODE, 'ack'), 0)}, Body status {lost.get((BODY_NODE, 'cmd'), 0)}"
+    line += f"\n{'':16s} Body status {body_stats['sent']}, retries {body_stats['retries']}, failed {body_stats['failed']}"
+    if csma is not None:
+        line += f"\n{'':16s} backoffs {csma.busy} ({csma.backoff_seconds * 1000:.0f} ms)  forced {csma.forced}"
+    print(line)
+
+
+if __name__ == "__main__":
+    print(f"{COMMANDS_SENT} commands to the Front panel during Body status bursts:")
+    run("no carrier", False)
+    run("carrier sense", True)
@@ -0,0 +1,306 @@
+"""
+Group command stand-in nodes
+Python stand-ins for the panel Feathers that follow the group command logic
+in the .ino files: check the node mask, confirm in the node's reply slot,
+wait out the reply window, then "start moving". Checks that every addressed
+node runs the command exactly once and measures the skew between the nodes'
+start times, for the broadcast group command and for one unicast per node.
+
+Without arguments everything runs off the Pi: the real RadioWorker talks to
+the stand-ins over a simulated channel with airtime, receive jitter, packet
+loss and collisions. One stand-in runs old firmware, so the unicast fallback
+is exercised too.
+
+    python3 group_node_standin.py
+    python3 group_node_standin.py --radio 20,30,40
+
+--radio answers for the listed nodes on a Pi with an RFM69 bonnet while the
+menu runs on the controller. All of them share one radio, so the skew shown
+is only the stand-in's own timing; it checks fan-out and the confirmations.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from r2n2_codec import (
+    GROUP_COMMAND_LEN,
+    PANEL_COMMAND_LEN,
+    RH_ACK_PAYLOAD,
+    RH_BROADCAST_ADDRESS,
+    RH_FLAGS_ACK,
+    RH_HEADER,
+    decode_frame,
+    decode_group_command,
+    decode_panel_command,
+)
+from r2n2_commands import (
+    BODY_NODE,
+    DOME_NODE,
+    FRONT_NODE,
+    GROUP_SEQUENCES,
+    NODE_BITS,
+    PI_NODE,
+    REAR_NODE,
+    SEQUENCES,
+)
+from r2n2_radio import RadioWorker
+
+# Same values as the .ino files.
+GROUP_REPLY_SLOT_SECONDS = 0.005
+GROUP_REPLY_SLOTS = 4
+
+ROUNDS = 60
+# RH_RF69 defaults: 250 kbps, 4 byte preamble, 2 sync bytes, length, CRC.
+BIT_SECONDS = 1 / 250000
+FRAME_OVERHEAD_BYTES = 4 + 2 + 1 + 2
+# PayloadReady interrupt to the Feather's loop() picking the packet up.
+RX_JITTER_SECONDS = (0.0002, 0.0015)
+LOSS = 0.03
+
+
+def airtime(frame):
+    return (len(frame) + FRAME_OVERHEAD_BYTES) * 8 * BIT_SECONDS
+
+
+def reply_slot(node):
+    return NODE_BITS[node].bit_length() - 1
+
+
+class SimChannel:
+    # Every frame reaches every radio after its airtime plus some receive
+    # jitter. Frames that overlap on air are lost for everyone.
+    def __init__(self, loss=LOSS):
+        self.loss = loss
+        self.radios = []
+        self.on_air = []
+        self.lock = threading.Lock()
+
+    def transmit(self, sender, frame):
+        start = time.monotonic()
+        tx = {"end": start + airtime(frame), "collided": False}
+        with self.lock:
+            self.on_air = [other for other in self.on_air if other["end"] > start]
+            for other in self.on_air:
+                other["collided"] = tx["collided"] = True
+            self.on_air.append(tx)
+
+        for radio in self.radios:
+            if radio is sender or random.random() < self.loss:
+                continue
+            delay = tx["end"] - start + random.uniform(*RX_JITTER_SECONDS)
+            threading.Timer(delay, self.deliver, (radio, tx, bytes(frame))).start()
+        time.sleep(tx["end"] - start)
+        return tx
+
+    def deliver(self, radio, tx, frame):
+        if not tx["collided"]:
+            radio.put(frame)
+
+
+class SimRadio:
+    # Enough of adafruit_rfm69.RFM69 for RadioWorker and the stand-ins.
+    def __init__(self, channel, node):
+        self.channel = channel
+        self.node = node
+        # adafruit_rfm69 returns RSSI as a float in half dB steps, and
+        # latches last_rssi for each packet received.
+        self.rssi = -50.5
+        self.last_rssi = -50.5
+        self.tx_power = 14
+        self.inbox = deque()
+        self.ready = threading.Condition()
+        channel.radios.append(self)
+
+    def put(self, frame):
+        with self.ready:
+            self.inbox.append(frame)
+            self.ready.notify()
+
+    def send(self, data, destination=RH_BROADCAST_ADDRESS, node=None, identifier=0, flags=0, keep_listening=True):
+        frame = RH_HEADER.pack(destination, self.node if node is None else node, identifier & 0xFF, flags) + bytes(data)
+        self.channel.transmit(self, frame)
+        return True
+
+    def receive(self, timeout=0.5, with_header=True, keep_listening=True):
+        with self.ready:
+            if not self.inbox and not self.ready.wait(timeout):
+                return None
+            if not self.inbox:
+                return None
+            frame = self.inbox.popleft()
+        if frame[0] not in (self.node, RH_BROADCAST_ADDRESS) and self.node != RH_BROADCAST_ADDRESS:
+            return None
+        return bytearray(frame)
+
+
+class StandInNode(threading.Thread):
+    # One Feather's loop(): RHReliableDatagram receive, ACK and duplicate
+    # handling, then the group command path from the .ino files.
+    def __init__(self, radio, node, group_firmware=True, started=None):
+        super().__init__(name=f"node{node}", daemon=True)
+        self.radio = radio
+        self.node = node
+        self.group_firmware = group_firmware
+        self.started = started if started is not None else []
+        self.seen = {}
+        self.stopping = threading.Event()
+
+    def ack(self, sender, ident):
+        self.radio.send(RH_ACK_PAYLOAD, destination=sender, node=self.node, identifier=ident, flags=RH_FLAGS_ACK)
+
+    def handle(self, frame, received_at):
+        decoded = decode_frame(frame)
+        if decoded is None:
+            return
+        dest, sender, ident, flags, body = decoded
+        if flags & RH_FLAGS_ACK or dest not in (self.node, RH_BROADCAST_ADDRESS):
+            return
+
+        if dest == self.node:
+            self.ack(sender, ident)
+        if self.seen.get(sender) == ident:
+            return
+        self.seen[sender] = ident
+
+        if dest == RH_BROADCAST_ADDRESS and len(body) == GROUP_COMMAND_LEN and self.group_firmware:
+            group = decode_group_command(body)
+            if not group.mask & NODE_BITS.get(self.node, 0):
+                return
+            self.wait_until(received_at + reply_slot(self.node) * GROUP_REPLY_SLOT_SECONDS)
+            self.ack(sender, ident)
+            self.wait_until(received_at + GROUP_REPLY_SLOTS * GROUP_REPLY_SLOT_SECONDS)
+            command = tuple(group[1:])
+        elif len(body) == PANEL_COMMAND_LEN:
+            command = tuple(decode_panel_command(body))
+        else:
+            return
+
+        self.started.append((time.monotonic(), self.node, ident, command))
+
+    def wait_until(self, when):
+        delay = when - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self):
+        while not self.stopping.is_set():
+            frame = self.radio.receive(0.05)
+            if frame is not None:
+                self.handle(frame, time.monotonic())
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, -(-pct * len(ordered) // 100) - 1)]
+
+
+def run_rounds(name, sequences, old_firmware=()):
+    random.seed(21)
+    channel = SimChannel()
+    started = []
+    nodes = [
+        StandInNode(SimRadio(channel, node), node, node not in old_firmware, started)
+        for node in (BODY_NODE, FRONT_NODE, REAR_NODE, DOME_NODE)
+    ]
+    for node in nodes:
+        node.start()
+
+    pi = SimRadio(channel, PI_NODE)
+    worker = RadioWorker(pi, PI_NODE, node_gap=0.15, tx_gap=0.02, ack_retries=3, trace=False)
+    results = []
+    worker.start()
+
+    skews = []
+    missed = 0
+    repeated = 0
+    fallbacks = 0
+    for n in range(ROUNDS):
+        sequence = sequences["open_all" if n % 2 == 0 else "close_all"]
+        expected = {member.dest for cmd in sequence for member in (cmd.members or (cmd,))}
+        del started[:]
+        del results[:]
+        idents = set()
+        for cmd in sequence:
+            idents.add(worker.send(cmd.label, cmd.dest, cmd.payload, on_done=results.append, members=cmd.radio_members))
+
+        deadline = time.monotonic() + 3.0
+        while time.monotonic() < deadline and len(results) < len(expected):
+            worker.poll_done()
+            time.sleep(0.005)
+        time.sleep(0.05)
+        worker.poll_done()
+
+        # A node whose confirmation got lost runs the fallback unicast as
+        # well. Harmless for open / close all, so counted apart from misses.
+        first = {}
+        for at, node, ident, command in started:
+            first.setdefault(node, at)
+        if set(first) != expected or not all(result.acked for result in results):
+            missed += 1
+        repeated += len(started) - len(first)
+        fallbacks += sum(1 for result in results if result.cmd.ident not in idents)
+        if set(first) == expected:
+            skews.append(max(first.values()) - min(first.values()))
+
+    worker.stop()
+    for node in nodes:
+        node.stopping.set()
+
+    skew_ms = [s * 1000 for s in skews]
+    print(
+        f"  {name:28s} missed {missed}  repeated {repeated:2d}  fallbacks {fallbacks:3d}"
+        f"  skew ms p50 {percentile(skew_ms, 50):5.1f} p95 {percentile(skew_ms, 95):5.1f} max {max(skew_ms):5.1f}"
+    )
+    return missed
+
+
+def simulate():
+    print(f"Open All / Close All x {ROUNDS}, {LOSS:.0%} loss per receiver:")
+    bad = run_rounds("unicast per node", SEQUENCES)
+    bad += run_rounds("broadcast group", GROUP_SEQUENCES)
+    bad += run_rounds("broadcast, Dome old firmware", GROUP_SEQUENCES, old_firmware=(DOME_NODE,))
+    return 1 if bad else 0
+
+
+def stand_in_on_radio(nodes):
+    import adafruit_rfm69
+    import board
+    import busio
+    from digitalio import DigitalInOut
+
+    spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
+    rfm69 = adafruit_rfm69.RFM69(spi, DigitalInOut(board.CE1), DigitalInOut(board.D25), 915.0)
+    rfm69.tx_power = 14
+    rfm69.node = RH_BROADCAST_ADDRESS
+    rfm69.encryption_key = None
+
+    started = []
+    stand_ins = {node: StandInNode(rfm69, node, True, started) for node in nodes}
+    print(f"Standing in for nodes {', '.join(map(str, nodes))}, Ctrl-C to stop")
+
+    while True:
+        frame = rfm69.receive(timeout=0.5, with_header=True)
+        if frame is None:
+            continue
+        received_at = time.monotonic()
+        del started[:]
+        # One radio, so the nodes take turns; each keeps its own reply slot.
+        for node in sorted(stand_ins, key=reply_slot):
+            stand_ins[node].handle(frame, received_at)
+        if started:
+            first = started[0][0]
+            for at, node, ident, command in started:
+                print(f"id {ident:3d} node {node}: {bytes(command).hex(' ')} +{(at - first) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--radio":
+        stand_in_on_radio([int(node) for node in sys.argv[2].split(",")])
+    else:
+        sys.exit(simulate())
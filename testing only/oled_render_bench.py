@@ -0,0 +1,95 @@
+"""
+OLED render bench: glyph table renderer vs PIL + framebuffer image()
+Checks the two give the same bytes, then times them. Runs without the OLED.
+"""
+
+import os
+import random
+import sys
+import time
+
+from PIL import ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from r2n2_oled import GlyphRenderer, OLED_GLYPHS, OLED_LINE_CHARS, OLED_LINE_HEIGHT, pil_framebuffer
+
+ROUNDS = 500
+CHECK_LINES = 300
+
+try:
+    import adafruit_framebuf
+except ImportError:
+    adafruit_framebuf = None
+
+
+def fonts():
+    # load_default() is the 5x7 bitmap font on older Pillow and FreeType on
+    # 10.1+, where the bitmap one is load_default_imagefont().
+    yield "load_default", ImageFont.load_default()
+    if hasattr(ImageFont, "load_default_imagefont"):
+        yield "load_default_imagefont", ImageFont.load_default_imagefont()
+
+
+def random_lines():
+    return tuple(
+        "".join(random.choice(OLED_GLYPHS) for _ in range(random.randint(0, OLED_LINE_CHARS)))
+        for _ in range(3)
+    )
+
+
+def status_lines():
+    return [
+        ("R2N2 Ready", "Wifi: Connected", ""),
+        ("TX Body", "Dome Open", "id 12"),
+        ("RX from 10 RSSI -42", "STEALTH RX Dome Open", "Sound 13: Cantina id 7"),
+    ]
+
+
+def pil_path(font, lines):
+    # What oled() did before: draw.text() into an image, then the per-pixel
+    # conversion adafruit_ssd1306 does in image().
+    if adafruit_framebuf is None:
+        return pil_framebuffer(font, lines)
+
+    from PIL import Image, ImageDraw
+    image = Image.new("1", (128, 32))
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        draw.text((0, row * OLED_LINE_HEIGHT), line, font=font, fill=255)
+    buf = bytearray(512)
+    fb = adafruit_framebuf.FrameBuffer(buf, 128, 32, adafruit_framebuf.MVLSB)
+    fb.image(image)
+    return buf
+
+
+def bench(name, func, samples):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        func(samples[i % len(samples)])
+    elapsed = time.perf_counter() - start
+    print(f"  {name:6s} {elapsed / ROUNDS * 1e6:9.1f} us/frame")
+    return elapsed
+
+
+random.seed(12)
+print("framebuffer reference:", "adafruit_framebuf" if adafruit_framebuf else "pil_framebuffer()")
+
+for font_name, font in fonts():
+    print(f"{font_name}:")
+    try:
+        renderer = GlyphRenderer(font)
+    except ValueError as exc:
+        print(f"  glyph renderer not usable ({exc}), OledWriter falls back to PIL")
+        continue
+
+    samples = status_lines() + [random_lines() for _ in range(CHECK_LINES)]
+    for lines in samples:
+        if renderer.render(lines) != pil_path(font, lines):
+            print(f"  MISMATCH for {lines!r}")
+            sys.exit(1)
+    print(f"  {len(samples)} frames byte-identical")
+
+    out = bytearray(512)
+    pil_time = bench("pil", lambda lines: pil_path(font, lines), samples)
+    glyph_time = bench("glyph", lambda lines: renderer.render(lines, out), samples)
+    print(f"  speedup {pil_time / glyph_time:.1f}x")
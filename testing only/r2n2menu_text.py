@@ -1,5 +1,6 @@
 # R2N2 Text-based Control Menu for use with Portable RPi5
 
+import os
 import time
 import sys
 import select
@@ -14,40 +15,36 @@ import adafruit_ssd1306
 from digitalio import DigitalInOut
 from PIL import Image, ImageDraw, ImageFont
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from r2n2_codec import decode_frame, format_frame
+from r2n2_commands import BODY_NODE, COMMANDS, PI_NODE, SEQUENCES, SOUND_COMMANDS
+from r2n2_radio import make_receiver
+
 
 RADIO_FREQ_MHZ = 915.0
 TX_POWER = 14
 
-PI_NODE = 99
-BODY_NODE = 10
-FRONT_NODE = 20
-REAR_NODE = 30
-DOME_NODE = 40
-
-ACTION_SERVO_GROUP_MOVE = 2
-ACTION_DOME_ALL_OPEN = 5
-ACTION_DOME_ALL_CLOSE = 6
-ACTION_STEALTH_SOUND = 0x30
-
-GROUP_ALL_SERVOS = 255
-SERVO_POS_OPEN = 1
-SERVO_POS_CLOSED = 2
-
-SOUND_BANKS = {
-    1: "General",
-    2: "Chatty",
-    3: "Sad",
-    4: "Burp",
-    5: "Whistle",
-    6: "Scream",
-    7: "Warning",
-    8: "Short",
-    9: "Leia",
-    10: "Imperial",
-    11: "Star Wars",
-    12: "Dance",
-    13: "Cantina",
+RX_BACKEND = "dio0"
+DIO0_GPIO_CHIP = "/dev/gpiochip0"
+DIO0_GPIO_LINE = 22
+
+# Keys that send commands, each mapped to the commands it sends in order.
+KEY_COMMANDS = {
+    "f": (COMMANDS["front_open"],),
+    "g": (COMMANDS["front_close"],),
+    "r": (COMMANDS["rear_open"],),
+    "t": (COMMANDS["rear_close"],),
+    "d": (COMMANDS["dome_open"],),
+    "e": (COMMANDS["dome_close"],),
+    "o": SEQUENCES["open_all"],
+    "c": SEQUENCES["close_all"],
+    "a": (SOUND_COMMANDS[10],),
+    "b": (SOUND_COMMANDS[11],),
+    "l": (SOUND_COMMANDS[12],),
+    "m": (SOUND_COMMANDS[13],),
 }
+for bank in range(1, 10):
+    KEY_COMMANDS[str(bank)] = (SOUND_COMMANDS[bank],)
 
 i2c = busio.I2C(board.SCL, board.SDA)
 oled_reset = DigitalInOut(board.D4)
@@ -64,6 +61,8 @@ rfm69.node = PI_NODE
 rfm69.destination = BODY_NODE
 rfm69.encryption_key = None
 
+receiver = make_receiver(rfm69, RX_BACKEND, DIO0_GPIO_CHIP, DIO0_GPIO_LINE)
+
 msg_id = 1
 
 
@@ -77,30 +76,6 @@ def oled(line1="", line2="", line3=""):
     display.show()
 
 
-def sound_label(bank):
-    return SOUND_BANKS.get(bank, f"Custom {bank}")
-
-
-def payload_group_open():
-    return bytes([ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0])
-
-
-def payload_group_close():
-    return bytes([ACTION_SERVO_GROUP_MOVE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0])
-
-
-def payload_dome_open():
-    return bytes([ACTION_DOME_ALL_OPEN, GROUP_ALL_SERVOS, SERVO_POS_OPEN, 0])
-
-
-def payload_dome_close():
-    return bytes([ACTION_DOME_ALL_CLOSE, GROUP_ALL_SERVOS, SERVO_POS_CLOSED, 0])
-
-
-def payload_sound_bank(bank):
-    return bytes([ACTION_STEALTH_SOUND, bank, 0x00, 0x00])
-
-
 def send_radio_command(label, dest, payload):
     global msg_id
 
@@ -126,19 +101,18 @@ def send_radio_command(label, dest, payload):
 
 
 def receive_once():
-    pkt = rfm69.receive(timeout=0.05, with_header=True)
+    pkt = receiver.receive(0.05)
     if pkt is None:
         return
 
-    if len(pkt) >= 4:
-        header = pkt[:4]
-        body = pkt[4:]
-        print(
-            f"RX RSSI {rfm69.rssi} | "
-            f"to={header[0]} from={header[1]} id={header[2]} "
-            f"flags=0x{header[3]:02X} | body={body.hex(' ')}"
-        )
-        oled("RX", f"from {header[1]}", f"RSSI {rfm69.rssi}")
+    frame = decode_frame(pkt)
+    if frame is None:
+        return
+
+    dest, sender, ident, flags, body = frame
+    rssi = rfm69.last_rssi
+    print("RX " + format_frame(dest, sender, ident, flags, body, rssi))
+    oled("RX", f"from {sender}", f"RSSI {rssi}")
 
 
 def clear_screen():
@@ -171,51 +145,12 @@ def show_menu():
     print()
 
 
-def open_all():
-    send_radio_command("Front Open", FRONT_NODE, payload_group_open())
-    send_radio_command("Rear Open", REAR_NODE, payload_group_open())
-    send_radio_command("Dome Open", DOME_NODE, payload_dome_open())
-
-
-def close_all():
-    send_radio_command("Dome Close", DOME_NODE, payload_dome_close())
-    send_radio_command("Rear Close", REAR_NODE, payload_group_close())
-    send_radio_command("Front Close", FRONT_NODE, payload_group_close())
-
-
-def play_sound(bank):
-    send_radio_command(f"Sound {bank}: {sound_label(bank)}", BODY_NODE, payload_sound_bank(bank))
-
-
 def handle_key(ch):
     ch = ch.lower()
 
-    if ch == "f":
-        send_radio_command("Front Open", FRONT_NODE, payload_group_open())
-    elif ch == "g":
-        send_radio_command("Front Close", FRONT_NODE, payload_group_close())
-    elif ch == "r":
-        send_radio_command("Rear Open", REAR_NODE, payload_group_open())
-    elif ch == "t":
-        send_radio_command("Rear Close", REAR_NODE, payload_group_close())
-    elif ch == "d":
-        send_radio_command("Dome Open", DOME_NODE, payload_dome_open())
-    elif ch == "e":
-        send_radio_command("Dome Close", DOME_NODE, payload_dome_close())
-    elif ch == "o":
-        open_all()
-    elif ch == "c":
-        close_all()
-    elif ch in "123456789":
-        play_sound(int(ch))
-    elif ch == "a":
-        play_sound(10)
-    elif ch == "b":
-        play_sound(11)
-    elif ch == "l":
-        play_sound(12)
-    elif ch == "m":
-        play_sound(13)
+    if ch in KEY_COMMANDS:
+        for cmd in KEY_COMMANDS[ch]:
+            send_radio_command(cmd.label, cmd.dest, cmd.payload)
     elif ch == "?":
         show_menu()
     elif ch == "q":
@@ -252,6 +187,8 @@ def main():
         if old_term_settings is not None:
             termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_term_settings)
 
+        receiver.close()
+
         oled("R2N2 Text", "Stopped", "")
 
 
@@ -0,0 +1,208 @@
+"""
+Radio worker checks
+Runs pieces of r2n2_radio against a fake RFM69 off the Pi and stops at the
+first thing that is wrong.
+
+    python3 radio_worker_check.py
+"""
+
+import os
+import sys
+import time
+
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from r2n2_airtime import AirtimeBudget
+from r2n2_codec import RH_ACK_PAYLOAD, RH_BROADCAST_ADDRESS, RH_FLAGS_ACK, RH_HEADER, panel_command
+from r2n2_commands import ACTION_STATUS_UPDATE, BODY_NODE, COMMANDS, FRONT_NODE, PI_NODE
+from r2n2_link import LinkTracker
+from r2n2_power import STEP_DOWN_AFTER, TX_POWER_STEP, TxPowerController
+from r2n2_radio import RF69_RX_MODE, Dio0Receiver, FakeDio0Line, RadioWorker
+
+STANDBY_MODE = 0b001
+
+
+class FakeRfm69:
+    # Enough of adafruit_rfm69.RFM69 for RadioWorker. Starts in standby
+    # like the driver does after init, and counts the receive calls. rssi
+    # reads the noise floor; last_rssi is latched at signal for each packet.
+    def __init__(self):
+        self.operation_mode = STANDBY_MODE
+        self.rssi = -95.0
+        self.last_rssi = 0.0
+        self.signal = -40.5
+        self.tx_power = 14
+        self.inbox = deque()
+        self.sent = []
+        self.receives = 0
+
+    def listen(self):
+        self.operation_mode = RF69_RX_MODE
+
+    def idle(self):
+        self.operation_mode = STANDBY_MODE
+
+    def send(self, data, destination=None, node=None, identifier=0, flags=0, keep_listening=True):
+        self.sent.append((destination, identifier, flags, bytes(data)))
+        self.operation_mode = RF69_RX_MODE if keep_listening else STANDBY_MODE
+        return True
+
+    def receive(self, timeout=None, with_header=True, keep_listening=True):
+        self.receives += 1
+        if not self.inbox:
+            return None
+        self.last_rssi = self.signal
+        self.operation_mode = RF69_RX_MODE if keep_listening else STANDBY_MODE
+        return bytearray(self.inbox.popleft())
+
+
+def frame_from(sender, ident, body, dest=PI_NODE):
+    return RH_HEADER.pack(dest, sender, ident, 0) + body
+
+
+class ListeningLine(FakeDio0Line):
+    # Notes whether the radio was in RX mode each time the receiver waits.
+    def __init__(self, radio):
+        super().__init__()
+        self.radio = radio
+        self.listening = []
+
+    def wait(self, timeout):
+        self.listening.append(self.radio.operation_mode == RF69_RX_MODE)
+        return super().wait(timeout)
+
+
+def check_dio0_listens():
+    radio = FakeRfm69()
+    line = ListeningLine(radio)
+    receiver = Dio0Receiver(radio, line)
+    assert receiver.receive(0.01) is None
+    assert line.listening == [True], "DIO0 wait started with the radio in standby"
+
+    # The worker picks up a packet on the edge.
+    worker = RadioWorker(radio, PI_NODE, trace=False, receiver=receiver)
+    radio.inbox.append(frame_from(BODY_NODE, 7, panel_command(ACTION_STATUS_UPDATE, 1, 2, 0)))
+    line.trigger()
+    assert worker.receive_once(0.01) is True
+    assert worker.rx_queue.get_nowait().sender == BODY_NODE
+
+    # Back to standby behind the worker's back, listening again before the
+    # next wait.
+    radio.idle()
+    assert receiver.receive(0.01) is None
+    assert line.listening[-1], "DIO0 wait after standby did not listen again"
+
+
+def check_rx_rssi_from_packet():
+    radio = FakeRfm69()
+    link = LinkTracker({BODY_NODE: "Body"})
+    worker = RadioWorker(radio, PI_NODE, trace=False, link=link)
+    radio.inbox.append(frame_from(BODY_NODE, 1, panel_command(ACTION_STATUS_UPDATE, 1, 2, 0)))
+    worker.receive_once(0)
+    assert worker.rx_queue.get_nowait().rssi == round(radio.signal), "RX RSSI is not the packet's"
+    assert link.summary(BODY_NODE).rssi == round(radio.signal)
+
+
+def worker_for(radio, **kwargs):
+    return RadioWorker(radio, PI_NODE, node_gap=0.0, tx_gap=0.0, ack_retries=1, trace=False, **kwargs)
+
+
+def send_command(worker, name):
+    cmd = COMMANDS[name]
+    worker.send(cmd.label, cmd.dest, cmd.payload, members=cmd.radio_members, targets=cmd.targets)
+
+
+def check_blocked_queue_waits():
+    # A unicast for a node inside the group reply window.
+    radio = FakeRfm69()
+    worker = worker_for(radio)
+    send_command(worker, "all_open")
+    worker.transmit_pending()
+    assert RH_BROADCAST_ADDRESS in worker.awaiting
+    send_command(worker, "charge_bay_toggle")
+    send_command(worker, "front_close")
+    worker.transmit_pending()
+    assert len(radio.sent) == 1
+    assert worker.rx_timeout() > 0, "receive wait is 0 while the group is pending"
+
+    # A group command behind a member's unACKed unicast.
+    radio = FakeRfm69()
+    worker = worker_for(radio)
+    send_command(worker, "front_open")
+    worker.transmit_pending()
+    send_command(worker, "all_close")
+    worker.transmit_pending()
+    assert len(radio.sent) == 1
+    assert worker.rx_timeout() > 0, "receive wait is 0 behind an unACKed member"
+
+
+def acked_sends(worker, radio, name, count):
+    # Sends the command count times, ACKing each from its node.
+    cmd = COMMANDS[name]
+    for n in range(count):
+        worker.send(cmd.label, cmd.dest, cmd.payload)
+        worker.transmit_pending()
+        dest, ident, flags, data = radio.sent[-1]
+        radio.inbox.append(RH_HEADER.pack(PI_NODE, dest, ident, RH_FLAGS_ACK) + RH_ACK_PAYLOAD)
+        worker.receive_once(0)
+        worker.node_ready_at.clear()
+
+
+def check_power_steps_down():
+    # A Front panel heard at -40 dBm has far more than the target margin,
+    # so clean ACKs step it down, one step per STEP_DOWN_AFTER of them.
+    radio = FakeRfm69()
+    link = LinkTracker({FRONT_NODE: "Front"})
+    power = TxPowerController(14, log=None)
+    worker = worker_for(radio, link=link, power=power)
+    acked_sends(worker, radio, "charge_bay_toggle", STEP_DOWN_AFTER * 2)
+    assert worker.outcome_for(FRONT_NODE)["acked"] == STEP_DOWN_AFTER * 2
+    assert power.power_for(FRONT_NODE) == 14 - 2 * TX_POWER_STEP, power.decisions
+    assert radio.tx_power == 14 - TX_POWER_STEP, "last send went out at the wrong power"
+
+    # The same ACKs heard near the noise floor keep full power.
+    radio = FakeRfm69()
+    radio.signal = -90.0
+    power = TxPowerController(14, log=None)
+    worker = worker_for(radio, link=LinkTracker({FRONT_NODE: "Front"}), power=power)
+    acked_sends(worker, radio, "charge_bay_toggle", STEP_DOWN_AFTER * 2)
+    assert power.power_for(FRONT_NODE) == 14 and not power.decisions
+
+
+def check_paced_counts_sends():
+    # A budget of one command per window: the second waits, and is counted
+    # once when it goes, however often the receive wait looks at it.
+    radio = FakeRfm69()
+    airtime = AirtimeBudget(window=0.05, budget=0.015)
+    worker = worker_for(radio, airtime=airtime)
+    send_command(worker, "front_open")
+    send_command(worker, "rear_open")
+    worker.transmit_pending()
+    for n in range(100):
+        worker.transmit_pending()
+        assert worker.rx_timeout() > 0
+    assert len(radio.sent) == 1 and worker.tx_paced == 0, worker.tx_paced
+
+    deadline = time.monotonic() + 1.0
+    while len(radio.sent) < 2 and time.monotonic() < deadline:
+        time.sleep(worker.rx_timeout())
+        airtime.expire(time.monotonic())
+        worker.transmit_pending()
+    assert len(radio.sent) == 2 and worker.tx_paced == 1, worker.tx_paced
+
+
+CHECKS = [
+    check_dio0_listens,
+    check_rx_rssi_from_packet,
+    check_blocked_queue_waits,
+    check_power_steps_down,
+    check_paced_counts_sends,
+]
+
+
+if __name__ == "__main__":
+    for check in CHECKS:
+        started = time.monotonic()
+        check()
+        print(f"{check.__name__}: ok ({(time.monotonic() - started) * 1000:.0f} ms)")